@@ -1,20 +1,53 @@
 import os
 import io
+import re
 import json
-from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify
+import time
+import hashlib
+import functools
+import zipfile
+import threading
+import tempfile
+import click
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify, stream_with_context, before_render_template, template_rendered, session, g, abort, has_request_context
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.utils import secure_filename
-from fitparse import FitFile
-from fpdf import FPDF
-import matplotlib.pyplot as plt
-import pandas as pd
+from werkzeug.http import is_resource_modified
+import numpy as np
+import charts
+import fit_import
+import trend
+import insights
+import cache
+import metrics
+import restore
+import columnar
+import search
+import catalog
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your_secret_key_here'
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///local.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Pre-ping replaces connections that died with a database restart instead of failing the next request
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_pre_ping': True, 'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800))}
+if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    # Per worker process; size it to at least GUNICORN_THREADS + REPORT_WORKERS
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'].update(pool_size=int(os.environ.get('DB_POOL_SIZE', 6)), max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', 4)),
+                                                   pool_timeout=int(os.environ.get('DB_POOL_TIMEOUT', 30)))
 app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['REPORT_FOLDER'] = os.path.join(os.environ.get('EXPORT_FOLDER', 'export'), 'reports')
+app.config['REPORT_CACHE_SIZE'] = int(os.environ.get('REPORT_CACHE_SIZE', 20))
+app.config['REPORT_TIMEOUT'] = int(os.environ.get('REPORT_TIMEOUT', 600))
+app.config['RESPONSE_CACHE_SIZE'] = int(os.environ.get('RESPONSE_CACHE_SIZE', 256))
+app.config['RESPONSE_CACHE_TTL'] = int(os.environ.get('RESPONSE_CACHE_TTL', 300))
+# Optional SQLite file shared by all workers; without it each process caches (and invalidates) on its own
+app.config['RESPONSE_CACHE_PATH'] = os.environ.get('RESPONSE_CACHE_PATH')
+# Optional directory shared by all workers, so /metrics reports the whole server instead of the worker that answers
+app.config['METRICS_PATH'] = os.environ.get('METRICS_PATH')
+app.config['SLOW_REQUEST_MS'] = int(os.environ.get('SLOW_REQUEST_MS', 0)) # log requests slower than this with their top statements; 0 = off
 
 db = SQLAlchemy(app)
 
@@ -28,10 +61,12 @@ class Marker(db.Model):
     max_norm = db.Column(db.Float)
 
     def to_dict(self):
-        return {'id': self.id, 'name': self.name, 'unit': self.unit or '', 'min_norm': self.min_norm or '', 'max_norm': self.max_norm or ''}
+        return {'id': self.id, 'name': self.name, 'unit': self.unit or '', 'min_norm': '' if self.min_norm is None else self.min_norm, 'max_norm': '' if self.max_norm is None else self.max_norm}
 
 class LabValue(db.Model):
+    __table_args__ = (db.Index('ix_lab_value_profile_id_date', 'profile_id', 'date'), db.Index('ix_lab_value_profile_id_name_date', 'profile_id', 'name', 'date'))
     id = db.Column(db.Integer, primary_key=True)
+    profile_id = db.Column(db.Integer, db.ForeignKey('profile.id'), nullable=False)
     date = db.Column(db.DateTime, nullable=False)
     name = db.Column(db.String(100), nullable=False)
     value = db.Column(db.Float, nullable=False)
@@ -39,16 +74,26 @@ class LabValue(db.Model):
     min_norm = db.Column(db.Float)
     max_norm = db.Column(db.Float)
 
+    @property
+    def range_status(self):
+        return reference_range(self.value, self.min_norm, self.max_norm)[0]
+
+    @property
+    def range_pos(self):
+        return reference_range(self.value, self.min_norm, self.max_norm)[1]
+
     def to_dict(self):
         return {
             'id': self.id, 'type': 'lab',
             'date': self.date.strftime('%Y-%m-%d'),
             'name': self.name, 'value': self.value, 'unit': self.unit or '',
-            'min_norm': self.min_norm or '', 'max_norm': self.max_norm or ''
+            'min_norm': '' if self.min_norm is None else self.min_norm, 'max_norm': '' if self.max_norm is None else self.max_norm
         }
 
 class VitalValue(db.Model):
+    __table_args__ = (db.Index('ix_vital_value_profile_id_date', 'profile_id', 'date'),)
     id = db.Column(db.Integer, primary_key=True)
+    profile_id = db.Column(db.Integer, db.ForeignKey('profile.id'), nullable=False)
     date = db.Column(db.DateTime, nullable=False)
     type = db.Column(db.String(50)) 
     value_sys = db.Column(db.Integer) 
@@ -60,11 +105,13 @@ class VitalValue(db.Model):
             'id': self.id, 'type': 'vital',
             'date': self.date.strftime('%Y-%m-%d'),
             'time': self.date.strftime('%H:%M'),
-            'sys': self.value_sys, 'dia': self.value_dia, 'pulse': self.value_pulse
+            'sys': self.value_sys, 'dia': self.value_dia, 'pulse': self.value_pulse, 'kind': self.type
         }
 
 class WeightEntry(db.Model):
+    __table_args__ = (db.Index('ix_weight_entry_profile_id_date', 'profile_id', 'date'),)
     id = db.Column(db.Integer, primary_key=True)
+    profile_id = db.Column(db.Integer, db.ForeignKey('profile.id'), nullable=False)
     date = db.Column(db.DateTime, nullable=False)
     weight = db.Column(db.Float, nullable=False)
     fat_percentage = db.Column(db.Float)
@@ -83,7 +130,8 @@ class WeightEntry(db.Model):
         return {
             'id': self.id, 
             'type': 'weight', 
-            'date': self.date.strftime('%Y-%m-%d'), 
+            'date': self.date.strftime('%Y-%m-%d'),
+            'time': self.date.strftime('%H:%M'),
             'weight': self.weight,
             'fat_percentage': self.fat_percentage,
             'bmi': self.bmi,
@@ -99,15 +147,20 @@ class WeightEntry(db.Model):
         }
 
 class Steps(db.Model):
+    # One row per profile and day
+    __table_args__ = (db.Index('uq_steps_profile_id_date', 'profile_id', 'date', unique=True),)
     id = db.Column(db.Integer, primary_key=True)
-    date = db.Column(db.DateTime, nullable=False, unique=True) 
+    profile_id = db.Column(db.Integer, db.ForeignKey('profile.id'), nullable=False)
+    date = db.Column(db.DateTime, nullable=False)
     count = db.Column(db.Integer, nullable=False)
 
     def to_dict(self):
         return {'id': self.id, 'type': 'steps', 'date': self.date.strftime('%Y-%m-%d'), 'count': self.count}
 
 class FoodEntry(db.Model):
+    __table_args__ = (db.Index('ix_food_entry_profile_id_date', 'profile_id', 'date'),)
     id = db.Column(db.Integer, primary_key=True)
+    profile_id = db.Column(db.Integer, db.ForeignKey('profile.id'), nullable=False)
     date = db.Column(db.DateTime, nullable=False)
     description = db.Column(db.String(200))
     calories = db.Column(db.Integer)
@@ -124,31 +177,40 @@ class FoodEntry(db.Model):
         }
 
 class Activity(db.Model):
+    # A Garmin activity is imported once per profile
+    __table_args__ = (db.Index('ix_activity_profile_id_date', 'profile_id', 'date'), db.Index('uq_activity_profile_id_garmin_id', 'profile_id', 'garmin_id', unique=True))
     id = db.Column(db.Integer, primary_key=True)
+    profile_id = db.Column(db.Integer, db.ForeignKey('profile.id'), nullable=False)
     date = db.Column(db.DateTime, nullable=False)
     type = db.Column(db.String(50))
     duration_min = db.Column(db.Integer)
     distance_km = db.Column(db.Float)
     source = db.Column(db.String(20)) 
-    garmin_id = db.Column(db.String(100), unique=True) 
+    garmin_id = db.Column(db.String(100)) 
 
     def to_dict(self):
         return {
             'id': self.id, 'type': 'activity', 'act_type': self.type,
             'date': self.date.strftime('%Y-%m-%d'),
             'time': self.date.strftime('%H:%M'),
-            'duration': self.duration_min, 'distance': self.distance_km or '', 'source': self.source
+            'duration': self.duration_min, 'distance': self.distance_km or '', 'source': self.source, 'garmin_id': self.garmin_id
         }
 
 class Profile(db.Model):
+    # One person of the household; every entry belongs to one (see current_profile_id)
     id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100))
     height_cm = db.Column(db.Float)
     birthdate = db.Column(db.Date)
     target_weight = db.Column(db.Float)
 
+    @property
+    def label(self):
+        return self.name or f"Profil {self.id}"
+
     def to_dict(self):
         return {
-            'height_cm': self.height_cm,
+            'name': self.name, 'height_cm': self.height_cm,
             'birthdate': self.birthdate.strftime('%Y-%m-%d') if self.birthdate else None,
             'target_weight': self.target_weight
         }
@@ -163,7 +225,9 @@ class Medication(db.Model):
         return {'id': self.id, 'name': self.name, 'unit': self.unit or '', 'common_dose': self.common_dose or ''}
 
 class MedicationEntry(db.Model):
+    __table_args__ = (db.Index('ix_medication_entry_profile_id_date', 'profile_id', 'date'), db.Index('ix_medication_entry_profile_id_medication_id_date', 'profile_id', 'medication_id', 'date'))
     id = db.Column(db.Integer, primary_key=True)
+    profile_id = db.Column(db.Integer, db.ForeignKey('profile.id'), nullable=False)
     date = db.Column(db.DateTime, nullable=False)
     medication_id = db.Column(db.Integer, db.ForeignKey('medication.id'), nullable=False)
     amount = db.Column(db.String(50), nullable=False) # Store as string to allow "1 Tablette" or "50"
@@ -177,7 +241,9 @@ class MedicationEntry(db.Model):
         }
 
 class MoodEntry(db.Model):
+    __table_args__ = (db.Index('ix_mood_entry_profile_id_date', 'profile_id', 'date'),)
     id = db.Column(db.Integer, primary_key=True)
+    profile_id = db.Column(db.Integer, db.ForeignKey('profile.id'), nullable=False)
     date = db.Column(db.DateTime, nullable=False)
     mood_score = db.Column(db.Integer) 
     energy_score = db.Column(db.Integer) 
@@ -190,16 +256,22 @@ class MoodEntry(db.Model):
         }
 
 class WaterEntry(db.Model):
+    # One row per profile and day; add_water_intake() increments it in place
+    __table_args__ = (db.Index('uq_water_entry_profile_id_date', 'profile_id', 'date', unique=True),)
     id = db.Column(db.Integer, primary_key=True)
-    date = db.Column(db.Date, nullable=False) 
+    profile_id = db.Column(db.Integer, db.ForeignKey('profile.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
     amount_ml = db.Column(db.Integer, nullable=False)
+    events = db.Column(db.Text) # JSON list of the last WATER_EVENTS intakes: [{"time": "HH:MM", "ml": 250}, ...]
 
     def to_dict(self):
-        return {'id': self.id, 'date': self.date.strftime('%Y-%m-%d'), 'amount_ml': self.amount_ml}
+        return {'id': self.id, 'date': self.date.strftime('%Y-%m-%d'), 'amount_ml': self.amount_ml, 'events': json.loads(self.events) if self.events else []}
 
 class SleepEntry(db.Model):
+    __table_args__ = (db.Index('ix_sleep_entry_profile_id_date', 'profile_id', 'date'),)
     id = db.Column(db.Integer, primary_key=True)
-    date = db.Column(db.Date, nullable=False) 
+    profile_id = db.Column(db.Integer, db.ForeignKey('profile.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
     duration_hours = db.Column(db.Float, nullable=False)
     quality = db.Column(db.Integer) 
 
@@ -209,6 +281,63 @@ class SleepEntry(db.Model):
             'duration': self.duration_hours, 'quality': self.quality
         }
 
+class DailyRollup(db.Model):
+    # One row per profile and day, maintained by the write routes (see refresh_rollups)
+    __table_args__ = (db.Index('ix_daily_rollup_profile_id_updated_at', 'profile_id', 'updated_at'),)
+    profile_id = db.Column(db.Integer, db.ForeignKey('profile.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    kcal = db.Column(db.Integer, default=0)
+    protein = db.Column(db.Float, default=0)
+    carbs = db.Column(db.Float, default=0)
+    fat = db.Column(db.Float, default=0)
+    water_ml = db.Column(db.Integer, default=0)
+    steps = db.Column(db.Integer)
+    weight = db.Column(db.Float) # last weigh-in of the day
+    sleep_hours = db.Column(db.Float)
+    mood_avg = db.Column(db.Float)
+    energy_avg = db.Column(db.Float)
+    sys_min = db.Column(db.Integer)
+    sys_max = db.Column(db.Integer)
+    sys_avg = db.Column(db.Float)
+    dia_min = db.Column(db.Integer)
+    dia_max = db.Column(db.Integer)
+    dia_avg = db.Column(db.Float)
+    pulse_min = db.Column(db.Integer)
+    pulse_max = db.Column(db.Integer)
+    pulse_avg = db.Column(db.Float)
+    med_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'date': self.date.strftime('%Y-%m-%d'),
+            'kcal': self.kcal or 0, 'protein': self.protein or 0, 'carbs': self.carbs or 0, 'fat': self.fat or 0,
+            'water_ml': self.water_ml or 0, 'steps': self.steps, 'weight': self.weight, 'sleep_hours': self.sleep_hours,
+            'mood_avg': self.mood_avg, 'energy_avg': self.energy_avg,
+            'sys': {'min': self.sys_min, 'max': self.sys_max, 'avg': self.sys_avg},
+            'dia': {'min': self.dia_min, 'max': self.dia_max, 'avg': self.dia_avg},
+            'pulse': {'min': self.pulse_min, 'max': self.pulse_max, 'avg': self.pulse_avg},
+            'med_count': self.med_count or 0
+        }
+
+class DataVersion(db.Model):
+    # Write counter per table, bumped on every commit that touches it (see bump_data_versions)
+    name = db.Column(db.String(200), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime)
+
+MODEL_MAP = {
+    'lab': LabValue, 'vital': VitalValue, 'weight': WeightEntry,
+    'steps': Steps, 'food': FoodEntry, 'activity': Activity,
+    'medication': MedicationEntry, 'sleep': SleepEntry, 'mood': MoodEntry,
+    'marker': Marker, 'med_def': Medication
+}
+
+# Entity lists shown as tables in the dashboard, paginated by (date, id)
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+LIST_TYPES = ('lab', 'vital', 'weight', 'steps', 'food', 'activity', 'medication', 'sleep', 'mood')
+
 # --- Helper Functions ---
 
 def allowed_file(filename):
@@ -228,119 +357,457 @@ def parse_date_str(date_str):
 def parse_datetime_str(date_str, time_str):
     return datetime.strptime(f"{date_str} {time_str}", '%Y-%m-%d %H:%M')
 
+def reference_range(value, lo, hi):
+    """('low' | 'ok' | 'high', dot position in % of the range bar) or (None, None) without a usable range.
+
+    The normal range spans the middle half of the bar (25-75%); positions are clamped to the bar.
+    """
+    if value is None or lo is None or hi is None or hi <= lo: return None, None
+    status = 'low' if value < lo else 'high' if value > hi else 'ok'
+    return status, round(min(max((value - lo) / (hi - lo) * 50 + 25, 0), 100), 1)
+
+def encode_cursor(obj):
+    return f"{obj.date.isoformat()},{obj.id}" if obj else None
+
+def parse_cursor(Model, cursor):
+    # "<iso date>,<id>" -> (date, id); Date columns (sleep, water) compare against plain dates
+    date_str, id_str = cursor.rsplit(',', 1)
+    d = datetime.fromisoformat(date_str)
+    if not isinstance(Model.date.type, db.DateTime): d = d.date()
+    return d, int(id_str)
+
+def keyset_page(Model, cursor=None, limit=PAGE_SIZE, ascending=False):
+    """One page of the current profile's Model ordered by (date, id), starting after `cursor`. Returns (rows, next_cursor)."""
+    q = scoped(Model)
+    if Model is MedicationEntry: q = q.options(db.joinedload(MedicationEntry.medication))
+    if cursor:
+        d, last_id = parse_cursor(Model, cursor)
+        if ascending: q = q.filter(db.or_(Model.date > d, db.and_(Model.date == d, Model.id > last_id)))
+        else: q = q.filter(db.or_(Model.date < d, db.and_(Model.date == d, Model.id < last_id)))
+    order = (Model.date.asc(), Model.id.asc()) if ascending else (Model.date.desc(), Model.id.desc())
+    rows = q.order_by(*order).limit(limit + 1).all()
+    if len(rows) > limit: return rows[:limit], encode_cursor(rows[limit - 1])
+    return rows, None
+
+def day_bounds(d):
+    return datetime.combine(d, datetime.min.time()), datetime.combine(d, datetime.max.time())
+
+def upsert_stmt(Model):
+    """INSERT that supports .on_conflict_do_update() on both Postgres and SQLite."""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(Model)
+
+# --- Data Versions ---
+
+def mark_changed(*tables):
+    """Record tables written outside the ORM unit of work (bulk Core statements) for the next commit."""
+    db.session.info.setdefault('changed_tables', set()).update(tables)
+
+@db.event.listens_for(db.session, 'before_flush')
+def _collect_changed_tables(session, flush_context, instances):
+    changed = session.info.setdefault('changed_tables', set())
+    for obj in [*session.new, *session.deleted, *(o for o in session.dirty if session.is_modified(o))]:
+        if not isinstance(obj, DataVersion): changed.add(obj.__tablename__)
+        # Lab series are cached per marker, so they get a counter per name as well (old name too on renames)
+        if isinstance(obj, LabValue): changed.update(lab_version_name(n) for n in {obj.name, *db.inspect(obj).attrs.name.history.deleted} if n)
+
+@db.event.listens_for(db.session, 'before_commit')
+def bump_data_versions(session):
+    session.flush()
+    changed = session.info.pop('changed_tables', None)
+    if not changed: return
+    stmt = upsert_stmt(DataVersion).values([{'name': t, 'version': 1, 'updated_at': datetime.now()} for t in sorted(changed)])
+    session.execute(stmt.on_conflict_do_update(index_elements=['name'], set_={'version': DataVersion.version + 1, 'updated_at': stmt.excluded.updated_at}))
+    session.info['committed_tables'] = changed
+
+@db.event.listens_for(db.session, 'after_commit')
+def _invalidate_response_cache(session):
+    response_cache.invalidate(session.info.pop('committed_tables', None))
+
+@db.event.listens_for(db.session, 'after_rollback')
+def _discard_changed_tables(session):
+    session.info.pop('changed_tables', None)
+    session.info.pop('committed_tables', None)
+
+def data_versions():
+    return {name: version for name, version in db.session.query(DataVersion.name, DataVersion.version)}
+
+def list_version(list_type, versions):
+    """Write counter(s) behind an entry table of the dashboard; the medication log shows the medication names as well."""
+    tables = [MODEL_MAP[list_type].__tablename__] + ([Medication.__tablename__] if list_type == 'medication' else [])
+    return '.'.join(str(versions.get(t, 0)) for t in tables)
+
+def data_fingerprint():
+    """Hash of the current profile, the day, the write counters and max(id) per table, so inserts made outside the app count as well."""
+    pid = current_profile_id()
+    state = {'profile': pid, 'day': datetime.now().date().isoformat(), 'versions': data_versions(), 'max_ids': {}}
+    for Model in [*EXPORT_SECTIONS.values(), Profile]:
+        q = db.session.query(db.func.max(Model.id))
+        state['max_ids'][Model.__tablename__] = (q.filter(Model.profile_id == pid) if hasattr(Model, 'profile_id') else q).scalar()
+    return hashlib.sha256(json.dumps(state, sort_keys=True).encode()).hexdigest()
+
+# --- Response Cache ---
+response_cache = cache.ResponseCache(app.config['RESPONSE_CACHE_SIZE'], app.config['RESPONSE_CACHE_TTL'], app.config['RESPONSE_CACHE_PATH'])
+ALL_TABLES = tuple(sorted(t for t in db.metadata.tables if t != DataVersion.__tablename__))
+
+def cached_response(*tables):
+    """Serve a GET view from response_cache, per profile, until one of `tables` (default: all) is written or the day changes."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = f"{view.__name__}:{current_profile_id()}:{request.full_path}:{datetime.now().date()}"
+            hit, token = response_cache.get(key, tables or ALL_TABLES)
+            if hit is None:
+                resp = app.make_response(view(*args, **kwargs))
+                if resp.status_code == 200 and not resp.is_streamed:
+                    response_cache.set(key, token, {'body': resp.get_data(), 'mimetype': resp.mimetype, 'etag': resp.get_etag()[0],
+                                                    'last_modified': resp.last_modified, 'cache_control': resp.headers.get('Cache-Control')})
+                return resp
+            resp = app.response_class(hit['body'], mimetype=hit['mimetype'])
+            if hit['etag']: resp.set_etag(hit['etag'])
+            resp.last_modified = hit['last_modified']
+            if hit['cache_control']: resp.headers['Cache-Control'] = hit['cache_control']
+            return resp.make_conditional(request) if hit['etag'] or hit['last_modified'] else resp
+        return wrapper
+    return decorator
+
+@app.route('/api/cache')
+def cache_stats():
+    return jsonify(response_cache.stats())
+
+# --- Profiles ---
+# Every entry belongs to a profile, one person of the household; markers and medication definitions are shared.
+# The current profile is the one chosen in the sidebar (kept in the session), ?profile=<id> for API clients, or the first one.
+_profiles = (None, {})
+
+def profiles():
+    """{id: Profile} of all profiles, cached until the profile table is written; an empty database gets its first profile here."""
+    global _profiles
+    token = response_cache.store.versions([Profile.__tablename__])
+    if _profiles[0] == token and _profiles[1]: return _profiles[1]
+    found = {p.id: p for p in Profile.query.order_by(Profile.id)}
+    if not found:
+        p = Profile(); db.session.add(p); db.session.commit()
+        return profiles()
+    for p in found.values(): db.session.expunge(p) # shared between requests, so detached
+    _profiles = (token, found)
+    return found
+
+def current_profile_id():
+    if 'profile_id' not in g:
+        known = profiles()
+        requested = request.args.get('profile') if has_request_context() else None
+        if requested is not None:
+            if safe_int(requested) not in known: abort(404, 'Unknown profile')
+            g.profile_id = safe_int(requested)
+        else:
+            chosen = session.get('profile_id') if has_request_context() else None
+            g.profile_id = chosen if chosen in known else next(iter(known))
+    return g.profile_id
+
+def current_profile():
+    return db.session.get(Profile, current_profile_id())
+
+def scoped(Model, profile_id=None):
+    """Model.query limited to the current profile (or `profile_id`)."""
+    return Model.query.filter(Model.profile_id == (profile_id or current_profile_id()))
+
+def owned_or_404(Model, id):
+    # Markers and medication definitions are shared by all profiles
+    q = scoped(Model) if hasattr(Model, 'profile_id') else Model.query
+    return q.filter(Model.id == id).first_or_404()
+
+@app.route('/switch_profile', methods=['POST'])
+def switch_profile():
+    profile_id = safe_int(request.form.get('profile_id'))
+    if profile_id in profiles(): session['profile_id'] = profile_id
+    return redirect(url_for('index'))
+
+@app.route('/add_profile', methods=['POST'])
+def add_profile():
+    name = (request.form.get('name') or '').strip()
+    if name:
+        p = Profile(name=name); db.session.add(p); db.session.commit()
+        session['profile_id'] = p.id
+    return redirect(url_for('index'))
+
+# --- Request Metrics ---
+request_metrics = metrics.Metrics(app.config['METRICS_PATH'], app.config['SLOW_REQUEST_MS'], logger=app.logger)
+with app.app_context(): request_metrics.instrument(db.engine, db.event)
+before_render_template.connect(request_metrics.before_render, app)
+template_rendered.connect(request_metrics.rendered, app)
+
+@app.before_request
+def _start_request_metrics():
+    request_metrics.start()
+
+@app.after_request
+def _record_status(resp):
+    request_metrics.set_status(resp.status_code)
+    return resp
+
+@app.teardown_request
+def _finish_request_metrics(exc):
+    # Teardown runs after a streamed body (stream_with_context) is sent, so /export is timed in full
+    request_metrics.finish(request.endpoint, request.method, request.path, failed=exc is not None)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return app.response_class(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# --- Daily Rollups ---
+
+def compute_rollup(d, profile_id=None):
+    """Aggregate all entries of day `d` of the current profile (or `profile_id`) into its DailyRollup row (created if missing)."""
+    pid = profile_id or current_profile_id()
+    start, end = day_bounds(d)
+    r = db.session.get(DailyRollup, (pid, d)) or DailyRollup(profile_id=pid, date=d)
+    if r not in db.session: db.session.add(r)
+    def q(Model, *cols): return db.session.query(*cols).filter(Model.profile_id == pid)
+    kcal, p, c, f = q(FoodEntry, db.func.sum(FoodEntry.calories), db.func.sum(FoodEntry.protein), db.func.sum(FoodEntry.carbs), db.func.sum(FoodEntry.fat)).filter(FoodEntry.date >= start, FoodEntry.date <= end).one()
+    r.kcal, r.protein, r.carbs, r.fat = kcal or 0, p or 0, c or 0, f or 0
+    r.water_ml = q(WaterEntry, WaterEntry.amount_ml).filter(WaterEntry.date == d).scalar() or 0
+    r.steps = q(Steps, Steps.count).filter(Steps.date == start).scalar()
+    r.weight = q(WeightEntry, WeightEntry.weight).filter(WeightEntry.date >= start, WeightEntry.date <= end).order_by(WeightEntry.date.desc(), WeightEntry.id.desc()).limit(1).scalar()
+    r.sleep_hours = q(SleepEntry, SleepEntry.duration_hours).filter(SleepEntry.date == d).limit(1).scalar()
+    r.mood_avg, r.energy_avg = q(MoodEntry, db.func.avg(MoodEntry.mood_score), db.func.avg(MoodEntry.energy_score)).filter(MoodEntry.date >= start, MoodEntry.date <= end).one()
+    (r.sys_min, r.sys_max, r.sys_avg, r.dia_min, r.dia_max, r.dia_avg, r.pulse_min, r.pulse_max, r.pulse_avg) = q(VitalValue,
+        db.func.min(VitalValue.value_sys), db.func.max(VitalValue.value_sys), db.func.avg(VitalValue.value_sys),
+        db.func.min(VitalValue.value_dia), db.func.max(VitalValue.value_dia), db.func.avg(VitalValue.value_dia),
+        db.func.min(VitalValue.value_pulse), db.func.max(VitalValue.value_pulse), db.func.avg(VitalValue.value_pulse)
+    ).filter(VitalValue.date >= start, VitalValue.date <= end).one()
+    r.med_count = q(MedicationEntry, db.func.count(MedicationEntry.id)).filter(MedicationEntry.date >= start, MedicationEntry.date <= end).scalar() or 0
+    r.updated_at = datetime.now()
+    return r
+
+def refresh_rollups(*values):
+    """Recompute the rollups of the current profile for every day touched by a write; accepts dates, datetimes or None."""
+    days = {v.date() if isinstance(v, datetime) else v for v in values if v is not None}
+    for d in sorted(days): compute_rollup(d)
+
+def recompute_rollups(*values):
+    """refresh_rollups() for bulk writes: the touched days are aggregated with one grouped query per table over
+    their date range (aggregate_rollups) and upserted in chunks, instead of compute_rollup() per day."""
+    days = {v.date() if isinstance(v, datetime) else v for v in values if v is not None}
+    if not days: return
+    pid = current_profile_id()
+    rows = aggregate_rollups(pid, min(days), max(days))
+    # Touched days without any entry left still get their (empty) row, as compute_rollup() would
+    rows = [rows.get((pid, d)) or empty_rollup(pid, d) for d in sorted(days)]
+    stmt = upsert_stmt(DailyRollup)
+    stmt = stmt.on_conflict_do_update(index_elements=['profile_id', 'date'], set_={c: stmt.excluded[c] for c in ROLLUP_VALUES})
+    for chunk in chunked(rows): db.session.execute(stmt, chunk) # executemany: compiled once, not per row
+    mark_changed(DailyRollup.__tablename__)
+
+ROLLUP_VALUES = [c.name for c in DailyRollup.__table__.columns if not c.primary_key]
+
+def empty_rollup(pid, d):
+    return {'profile_id': pid, 'date': d, 'kcal': 0, 'protein': 0, 'carbs': 0, 'fat': 0, 'water_ml': 0, 'steps': None, 'weight': None,
+            'sleep_hours': None, 'mood_avg': None, 'energy_avg': None, **{f"{c}_{a}": None for c in ('sys', 'dia', 'pulse') for a in ('min', 'max', 'avg')},
+            'med_count': 0, 'updated_at': datetime.now()}
+
+def aggregate_rollups(profile_id=None, start=None, end=None):
+    """{(profile_id, date): rollup row} for every day with any entry, with one grouped scan per table.
+
+    Covers all profiles or only `profile_id`, and all days or only start <= day <= end (dates).
+    """
+    rows = {}
+    def day(pid, v):
+        d = v.date() if isinstance(v, datetime) else v if not isinstance(v, str) else datetime.strptime(v, '%Y-%m-%d').date() # SQLite's date() returns text
+        return rows.setdefault((pid, d), empty_rollup(pid, d))
+    def rows_of(Model, *cols):
+        q = db.session.query(Model.profile_id, *cols)
+        if profile_id: q = q.filter(Model.profile_id == profile_id)
+        # Date columns compare with the days themselves, DateTime columns with the bounds of the days
+        timed = isinstance(Model.date.type, db.DateTime)
+        if start: q = q.filter(Model.date >= (day_bounds(start)[0] if timed else start))
+        if end: q = q.filter(Model.date <= (day_bounds(end)[1] if timed else end))
+        return q
+    def by_day(Model, *cols): return rows_of(Model, db.func.date(Model.date), *cols).group_by(Model.profile_id, db.func.date(Model.date))
+    for pid, d, kcal, p, c, f in by_day(FoodEntry, db.func.sum(FoodEntry.calories), db.func.sum(FoodEntry.protein), db.func.sum(FoodEntry.carbs), db.func.sum(FoodEntry.fat)):
+        day(pid, d).update(kcal=kcal or 0, protein=p or 0, carbs=c or 0, fat=f or 0)
+    for pid, d, ml in rows_of(WaterEntry, WaterEntry.date, WaterEntry.amount_ml): day(pid, d)['water_ml'] = ml or 0
+    for pid, d, count in rows_of(Steps, Steps.date, Steps.count): day(pid, d)['steps'] = count
+    for pid, d, w in rows_of(WeightEntry, WeightEntry.date, WeightEntry.weight).order_by(WeightEntry.date, WeightEntry.id): day(pid, d)['weight'] = w # last of the day wins
+    for pid, d, h in rows_of(SleepEntry, SleepEntry.date, SleepEntry.duration_hours).order_by(SleepEntry.id.desc()): day(pid, d)['sleep_hours'] = h
+    for pid, d, mood, energy in by_day(MoodEntry, db.func.avg(MoodEntry.mood_score), db.func.avg(MoodEntry.energy_score)): day(pid, d).update(mood_avg=mood, energy_avg=energy)
+    for pid, d, *v in by_day(VitalValue, *(fn(col) for col in (VitalValue.value_sys, VitalValue.value_dia, VitalValue.value_pulse) for fn in (db.func.min, db.func.max, db.func.avg))):
+        day(pid, d).update(zip((f"{c}_{a}" for c in ('sys', 'dia', 'pulse') for a in ('min', 'max', 'avg')), v))
+    for pid, d, n in by_day(MedicationEntry, db.func.count(MedicationEntry.id)): day(pid, d)['med_count'] = n
+    return rows
+
+def rebuild_rollups(profile_id=None):
+    """Backfill: recompute the rollup of every day that has any entry (see aggregate_rollups), for all profiles or only `profile_id`."""
+    rows = aggregate_rollups(profile_id)
+    (scoped(DailyRollup, profile_id) if profile_id else DailyRollup.query).delete()
+    for chunk in chunked([rows[k] for k in sorted(rows)]): db.session.execute(db.insert(DailyRollup), chunk)
+    mark_changed(DailyRollup.__tablename__)
+    db.session.commit()
+    return len(rows)
+
+def rollup_range(start, end):
+    return scoped(DailyRollup).filter(DailyRollup.date >= start, DailyRollup.date <= end).order_by(DailyRollup.date).all()
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the DailyRollup table from all entries of all profiles."""
+    print(f"Rebuilt rollups for {rebuild_rollups()} days.")
+
+# --- Indexes ---
+
+def ensure_indexes():
+    """Create every index declared on the models; create_all() only does this for new tables.
+
+    Indexes on columns a table does not have yet are left to the migration that adds them.
+    """
+    inspector = db.inspect(db.session.connection())
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name): continue
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        for idx in sorted(table.indexes, key=lambda i: i.name):
+            if any(c.name not in existing for c in idx.columns): continue
+            cols = ', '.join(c.name for c in idx.columns)
+            unique = 'UNIQUE ' if idx.unique else ''
+            db.session.execute(db.text(f"CREATE {unique}INDEX IF NOT EXISTS {idx.name} ON {table.name} ({cols})"))
+    db.session.commit()
+
+def index_check_queries():
+    """The range scans of daily_summary() and the ordered page scans of index() for one profile, by label."""
+    start, end = day_bounds(datetime.now().date())
+    queries = []
+    for Model in (WeightEntry, FoodEntry, VitalValue, Activity, MoodEntry, MedicationEntry, LabValue):
+        queries.append((f"daily_summary {Model.__tablename__}", scoped(Model).filter(Model.date >= start, Model.date <= end)))
+    for Model in (SleepEntry, WaterEntry):
+        queries.append((f"daily_summary {Model.__tablename__}", scoped(Model).filter(Model.date == start.date())))
+    for t in LIST_TYPES:
+        Model = MODEL_MAP[t]
+        queries.append((f"index page {Model.__tablename__}", scoped(Model).order_by(Model.date.desc(), Model.id.desc()).limit(PAGE_SIZE)))
+    queries.append(("lab trend by name", scoped(LabValue).filter(LabValue.name == 'x').order_by(LabValue.date)))
+    queries.append(("medication log by medication", scoped(MedicationEntry).filter(MedicationEntry.medication_id == 1).order_by(MedicationEntry.date)))
+    return queries
+
+@app.cli.command('check-indexes')
+def check_indexes_command():
+    """Print the query plan of the hot dashboard queries and whether they use an index."""
+    conn = db.session.connection()
+    sqlite = conn.dialect.name == 'sqlite'
+    # Tiny tables make Postgres prefer seq scans regardless; ask whether an index path exists at all
+    if not sqlite: conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    for label, query in index_check_queries():
+        compiled = query.statement.compile(dialect=conn.dialect)
+        params = tuple(compiled.params[k] for k in compiled.positiontup) if compiled.positional else compiled.params
+        rows = conn.exec_driver_sql(("EXPLAIN QUERY PLAN " if sqlite else "EXPLAIN ") + str(compiled), params).fetchall()
+        plan = [r[-1] for r in rows]
+        uses_index = any('INDEX' in line.upper() for line in plan)
+        print(f"{'OK  ' if uses_index else 'SCAN'} {label}")
+        for line in plan: print(f"       {line}")
+    db.session.rollback()
+
+# --- Weight Trend ---
+_weight_trend = {} # profile id -> (key, stats)
+
+def weight_loss_stats(profile):
+    """Goal progress from trend.project_weight(); recomputed only when a weigh-in, the target weight or the day changes."""
+    target = getattr(profile, 'target_weight', None) if profile else None
+    if not target: return None
+    version = db.session.query(DataVersion.version).filter(DataVersion.name == 'weight_entry').scalar()
+    key = (version, db.session.query(db.func.max(WeightEntry.id)).filter(WeightEntry.profile_id == profile.id).scalar(), target, datetime.now().date())
+    cached = _weight_trend.get(profile.id)
+    if cached and cached[0] == key: return cached[1]
+    rows = db.session.query(WeightEntry.date, WeightEntry.weight).filter(WeightEntry.profile_id == profile.id).order_by(WeightEntry.date, WeightEntry.id).all()
+    stats = None
+    if rows:
+        dates, weights = zip(*rows)
+        p = trend.project_weight(dates, weights, target, datetime.now())
+        def fmt(d): return d.strftime('%d.%m.%Y') if d else None
+        stats = {
+            'lost_so_far': round(p['lost_so_far'], 1), 'remaining': round(p['remaining'], 1),
+            'days_to_go': p['days_to_go'], 'est_date': fmt(p['est_date']) or 'N/A',
+            'est_early': fmt(p['est_early']), 'est_late': fmt(p['est_late']),
+            'daily_rate': round(p['daily_rate'], 3), 'trend_weight': round(p['trend_weight'], 1) if p['trend_weight'] is not None else None
+        }
+    _weight_trend[profile.id] = (key, stats)
+    return stats
+
 # --- Routes ---
 
 @app.route('/', methods=['GET'])
+@cached_response()
 def index():
     sort_order = request.args.get('sort', 'desc')
-    sort_dir = sort_order
-    def get_sort(model): return model.date.asc() if sort_dir == 'asc' else model.date.desc()
 
-    lab_values = LabValue.query.order_by(get_sort(LabValue)).all()
+    # The entry tables are fetched from /api/<type> when their tab is opened; the browser keeps them until list_versions change
+    versions = data_versions()
+    list_versions = {t: list_version(t, versions) for t in LIST_TYPES}
     markers = Marker.query.order_by(Marker.name).all()
-    vitals = VitalValue.query.order_by(get_sort(VitalValue)).all()
-    weights = WeightEntry.query.order_by(get_sort(WeightEntry)).all()
-    foods = FoodEntry.query.order_by(get_sort(FoodEntry)).all()
-    activities = Activity.query.order_by(get_sort(Activity)).all()
-    steps = Steps.query.order_by(get_sort(Steps)).all()
     meds_def = Medication.query.all()
-    meds_log = MedicationEntry.query.order_by(get_sort(MedicationEntry)).all()
-    moods = MoodEntry.query.order_by(get_sort(MoodEntry)).all()
-    sleeps = SleepEntry.query.order_by(SleepEntry.date.desc() if sort_dir == 'desc' else SleepEntry.date.asc()).all()
-    water_today = db.session.query(db.func.sum(WaterEntry.amount_ml)).filter(WaterEntry.date == datetime.now().date()).scalar() or 0
-    
+    pid = current_profile_id()
+    water_today = db.session.query(WaterEntry.amount_ml).filter(WaterEntry.profile_id == pid, WaterEntry.date == datetime.now().date()).scalar() or 0
+
+    today_start = datetime.combine(datetime.now().date(), datetime.min.time())
+    latest_weight = scoped(WeightEntry).order_by(WeightEntry.date.desc(), WeightEntry.id.desc()).first()
+    steps_today = scoped(Steps).filter(Steps.date == today_start).first()
+    mood_today = scoped(MoodEntry).filter(MoodEntry.date >= today_start, MoodEntry.date < today_start + timedelta(days=1)).order_by(MoodEntry.date.desc(), MoodEntry.id.desc()).first()
+
     recent_history = []
+    today = datetime.now().date()
+    rollups = {r.date: r for r in rollup_range(today - timedelta(days=2), today)}
     for i in range(3):
-        d = (datetime.now() - pd.Timedelta(days=i)).date()
-        d_start = datetime.combine(d, datetime.min.time()); d_end = datetime.combine(d, datetime.max.time())
-        day_steps = Steps.query.filter(Steps.date == d_start).first()
-        day_weight = WeightEntry.query.filter(WeightEntry.date >= d_start, WeightEntry.date <= d_end).first()
-        day_sleep = SleepEntry.query.filter(SleepEntry.date == d).first()
-        day_foods = FoodEntry.query.filter(FoodEntry.date >= d_start, FoodEntry.date <= d_end).all()
-        macros = {'kcal': 0, 'p': 0, 'c': 0, 'f': 0}
-        for f in day_foods:
-            macros['kcal'] += (f.calories or 0); macros['p'] += (f.protein or 0); macros['c'] += (f.carbs or 0); macros['f'] += (f.fat or 0)
-        recent_history.append({'date': d, 'steps': day_steps.count if day_steps else None, 'weight': day_weight.weight if day_weight else None, 'sleep': day_sleep.duration_hours if day_sleep else None, 'macros': macros})
+        d = today - timedelta(days=i); r = rollups.get(d)
+        macros = {'kcal': r.kcal, 'p': r.protein, 'c': r.carbs, 'f': r.fat} if r else {'kcal': 0, 'p': 0, 'c': 0, 'f': 0}
+        recent_history.append({'date': d, 'steps': r.steps if r else None, 'weight': r.weight if r else None, 'sleep': r.sleep_hours if r else None, 'macros': macros})
 
-    try:
-        profile = Profile.query.first()
-    except Exception:
-        profile = None
-    
-    # Weight loss stats
-    weight_stats = None
-    if weights and profile and getattr(profile, 'target_weight', None):
-        sorted_weights = sorted(weights, key=lambda x: x.date)
-        first_w_ever = sorted_weights[0]
-        last_w = sorted_weights[-1]
-        
-        lost_so_far = first_w_ever.weight - last_w.weight
-        remaining = last_w.weight - profile.target_weight
-        
-        # Calculate loss rate using a "recent window" (last 30 days) for better accuracy
-        now_dt = datetime.now()
-        thirty_days_ago = now_dt - pd.Timedelta(days=30)
-        recent_weights = [w for w in sorted_weights if w.date >= thirty_days_ago]
-        
-        # If we don't have enough recent data (at least 7 days apart), use all data
-        if len(recent_weights) >= 2 and (recent_weights[-1].date - recent_weights[0].date).days >= 7:
-            rate_weights = recent_weights
-        else:
-            rate_weights = sorted_weights
-
-        days_diff = (rate_weights[-1].date - rate_weights[0].date).days
-        weight_diff = rate_weights[0].weight - rate_weights[-1].weight
-        
-        days_to_go = None
-        est_date = None
-        daily_rate = 0
-        
-        if days_diff > 0: # Show projection as soon as we have at least 2 measurements at different times
-            daily_rate = weight_diff / days_diff
-            if daily_rate > 0:
-                days_to_go = int(remaining / daily_rate)
-                est_date = now_dt + pd.Timedelta(days=days_to_go)
-            
-        weight_stats = {
-            'lost_so_far': round(lost_so_far, 1),
-            'remaining': round(remaining, 1),
-            'days_to_go': days_to_go,
-            'est_date': est_date.strftime('%d.%m.%Y') if est_date else 'N/A',
-            'daily_rate': round(daily_rate, 3)
-        }
+    profile = current_profile()
+    weight_stats = weight_loss_stats(profile)
 
-    return render_template('index.html', labs=lab_values, markers=markers, vitals=vitals, weights=weights, foods=foods, activities=activities, steps=steps, meds_def=meds_def, meds_log=meds_log, moods=moods, profile=profile, sleeps=sleeps, water_today=water_today, recent_history=recent_history, sort_order=sort_order, now=datetime.now(), weight_stats=weight_stats) 
+    return render_template('index.html', markers=markers, meds_def=meds_def, profile=profile, profiles=list(profiles().values()), water_today=water_today, recent_history=recent_history, sort_order=sort_order, now=datetime.now(), weight_stats=weight_stats, list_versions=list_versions, latest_weight=latest_weight, steps_today=steps_today, mood_today=mood_today)
 
 # --- CRUD Routes ---
 
 @app.route('/save_profile', methods=['POST'])
 def save_profile():
-    p = Profile.query.first() or Profile()
-    if not p.id: db.session.add(p)
+    p = current_profile()
+    p.name = (request.form.get('name') or '').strip() or None
     p.height_cm = safe_float(request.form.get('height'))
     p.target_weight = safe_float(request.form.get('target_weight'))
     bd = request.form.get('birthdate')
     if bd: p.birthdate = parse_date_str(bd)
     db.session.commit(); return redirect(url_for('index'))
 
+WATER_EVENTS = 20
+
+def add_water_intake(d, amount, at=None):
+    """Add `amount` ml to the day's counter with one atomic upsert; `at` (a datetime) is also logged as an event."""
+    stmt = upsert_stmt(WaterEntry).values(profile_id=current_profile_id(), date=d, amount_ml=amount)
+    stmt = stmt.on_conflict_do_update(index_elements=['profile_id', 'date'], set_={'amount_ml': WaterEntry.amount_ml + stmt.excluded.amount_ml})
+    row = db.session.execute(stmt.returning(WaterEntry.id, WaterEntry.events)).one()
+    if at:
+        # The upsert holds the row's write lock until commit, so this read-modify-write cannot interleave
+        events = (json.loads(row.events) if row.events else []) + [{'time': at.strftime('%H:%M'), 'ml': amount}]
+        db.session.execute(db.update(WaterEntry).where(WaterEntry.id == row.id).values(events=json.dumps(events[-WATER_EVENTS:])))
+    mark_changed(WaterEntry.__tablename__)
+
 @app.route('/add_water', methods=['POST'])
 def add_water():
     amount = safe_int(request.form.get('amount'))
-    if amount: db.session.add(WaterEntry(date=datetime.now().date(), amount_ml=amount)); db.session.commit()
+    if amount: add_water_intake(datetime.now().date(), amount, datetime.now()); refresh_rollups(datetime.now().date()); db.session.commit()
     return redirect(url_for('index'))
 
 @app.route('/reset_water', methods=['POST'])
 def reset_water():
-    WaterEntry.query.filter_by(date=datetime.now().date()).delete(); db.session.commit(); return redirect(url_for('index'))
+    scoped(WaterEntry).filter_by(date=datetime.now().date()).delete(); refresh_rollups(datetime.now().date()); db.session.commit(); return redirect(url_for('index'))
 
 @app.route('/add_sleep', methods=['POST'])
 def add_sleep():
     date = parse_date_str(request.form.get('date')).date()
     duration = safe_float(request.form.get('duration')); quality = safe_int(request.form.get('quality'))
-    existing = SleepEntry.query.filter_by(date=date).first()
+    existing = scoped(SleepEntry).filter_by(date=date).first()
     if existing: existing.duration_hours = duration; existing.quality = quality
-    else: db.session.add(SleepEntry(date=date, duration_hours=duration, quality=quality))
-    db.session.commit(); return redirect(url_for('index'))
+    else: db.session.add(SleepEntry(profile_id=current_profile_id(), date=date, duration_hours=duration, quality=quality))
+    refresh_rollups(date); db.session.commit(); return redirect(url_for('index'))
 
 @app.route('/add_medication_def', methods=['POST'])
 def add_medication_def():
@@ -352,27 +819,30 @@ def add_medication_def():
 def add_medication_entry():
     date = parse_date_str(request.form.get('date')); med_id = request.form.get('med_id')
     amount = request.form.get('amount_custom') or request.form.get('amount_select')
-    if med_id and amount: db.session.add(MedicationEntry(date=date, medication_id=med_id, amount=amount)); db.session.commit()
+    if med_id and amount: db.session.add(MedicationEntry(profile_id=current_profile_id(), date=date, medication_id=med_id, amount=amount)); refresh_rollups(date); db.session.commit()
     return redirect(url_for('index'))
 
 @app.route('/add_mood', methods=['POST'])
 def add_mood():
-    db.session.add(MoodEntry(date=parse_date_str(request.form.get('date')), mood_score=safe_int(request.form.get('mood')), energy_score=safe_int(request.form.get('energy')), notes=request.form.get('notes')))
+    entry = MoodEntry(profile_id=current_profile_id(), date=parse_date_str(request.form.get('date')), mood_score=safe_int(request.form.get('mood')), energy_score=safe_int(request.form.get('energy')), notes=request.form.get('notes'))
+    db.session.add(entry); refresh_rollups(entry.date)
     db.session.commit(); return redirect(url_for('index'))
 
 @app.route('/add_lab', methods=['POST'])
 def add_lab():
-    db.session.add(LabValue(date=parse_date_str(request.form['date']), name=request.form['name'], value=safe_float(request.form['value']), unit=request.form.get('unit'), min_norm=safe_float(request.form.get('min_norm')), max_norm=safe_float(request.form.get('max_norm'))))
+    db.session.add(LabValue(profile_id=current_profile_id(), date=parse_date_str(request.form['date']), name=request.form['name'], value=safe_float(request.form['value']), unit=request.form.get('unit'), min_norm=safe_float(request.form.get('min_norm')), max_norm=safe_float(request.form.get('max_norm'))))
     db.session.commit(); return redirect(url_for('index'))
 
 @app.route('/add_vital', methods=['POST'])
 def add_vital():
-    db.session.add(VitalValue(date=parse_datetime_str(request.form['date'], request.form['time']), type='Blutdruck/Puls', value_sys=safe_int(request.form['sys']), value_dia=safe_int(request.form['dia']), value_pulse=safe_int(request.form['pulse'])))
+    entry = VitalValue(profile_id=current_profile_id(), date=parse_datetime_str(request.form['date'], request.form['time']), type='Blutdruck/Puls', value_sys=safe_int(request.form['sys']), value_dia=safe_int(request.form['dia']), value_pulse=safe_int(request.form['pulse']))
+    db.session.add(entry); refresh_rollups(entry.date)
     db.session.commit(); return redirect(url_for('index'))
 
 @app.route('/add_weight', methods=['POST'])
 def add_weight():
-    db.session.add(WeightEntry(
+    entry = WeightEntry(
+        profile_id=current_profile_id(),
         date=parse_datetime_str(request.form['weight_date'], request.form.get('weight_time', '00:00')), 
         weight=safe_float(request.form['weight_val']),
         fat_percentage=safe_float(request.form.get('fat_percentage')),
@@ -386,50 +856,202 @@ def add_weight():
         visceral_fat=safe_float(request.form.get('visceral_fat')),
         body_water=safe_float(request.form.get('body_water')),
         bone_mass=safe_float(request.form.get('bone_mass'))
-    ))
+    )
+    db.session.add(entry); refresh_rollups(entry.date)
     db.session.commit(); return redirect(url_for('index'))
 
 @app.route('/add_steps', methods=['POST'])
 def add_steps():
-    dt = parse_date_str(request.form['steps_date']); existing = Steps.query.filter(Steps.date == dt).first()
+    dt = parse_date_str(request.form['steps_date']); existing = scoped(Steps).filter(Steps.date == dt).first()
     if existing: existing.count = safe_int(request.form['steps_count'])
-    else: db.session.add(Steps(date=dt, count=safe_int(request.form['steps_count'])))
-    db.session.commit(); return redirect(url_for('index'))
+    else: db.session.add(Steps(profile_id=current_profile_id(), date=dt, count=safe_int(request.form['steps_count'])))
+    refresh_rollups(dt); db.session.commit(); return redirect(url_for('index'))
 
 @app.route('/add_food', methods=['POST'])
 def add_food():
-    db.session.add(FoodEntry(date=parse_date_str(request.form['food_date']), description=request.form['food_desc'], calories=safe_int(request.form.get('food_cal')), protein=safe_float(request.form.get('food_pro')), carbs=safe_float(request.form.get('food_carb')), fat=safe_float(request.form.get('food_fat'))))
+    entry = FoodEntry(profile_id=current_profile_id(), date=parse_date_str(request.form['food_date']), description=request.form['food_desc'], calories=safe_int(request.form.get('food_cal')), protein=safe_float(request.form.get('food_pro')), carbs=safe_float(request.form.get('food_carb')), fat=safe_float(request.form.get('food_fat')))
+    db.session.add(entry); refresh_rollups(entry.date)
     db.session.commit(); return redirect(url_for('index'))
 
 @app.route('/add_activity', methods=['POST'])
 def add_activity():
-    db.session.add(Activity(date=parse_datetime_str(request.form['date'], request.form['time']), type=request.form['act_type'], duration_min=safe_int(request.form['act_duration']), distance_km=safe_float(request.form.get('act_distance')), source='manual'))
+    db.session.add(Activity(profile_id=current_profile_id(), date=parse_datetime_str(request.form['date'], request.form['time']), type=request.form['act_type'], duration_min=safe_int(request.form['act_duration']), distance_km=safe_float(request.form.get('act_distance')), source='manual'))
     db.session.commit(); return redirect(url_for('index'))
 
+# --- Garmin Import ---
+IMPORT_CHUNK = 500
+
+def chunked(rows, size=IMPORT_CHUNK):
+    for i in range(0, len(rows), size): yield rows[i:i + size]
+
+def import_fit_results(results):
+    """Merge parsed FIT files and write them into the current profile in one transaction; returns the row counts per kind."""
+    pid = current_profile_id()
+    activities, steps, weights, heart_rate = {}, {}, {}, {}
+    for r in results:
+        activities.update((a['garmin_id'], {**a, 'profile_id': pid}) for a in r['activities'])
+        for day, count in r['steps'].items(): steps[day] = max(steps.get(day, 0), count)
+        weights.update((w['date'], {**w, 'profile_id': pid}) for w in r['weights'])
+        heart_rate.update(r['heart_rate'])
+
+    for rows in chunked(list(activities.values())):
+        stmt = upsert_stmt(Activity).values(rows)
+        db.session.execute(stmt.on_conflict_do_update(index_elements=['profile_id', 'garmin_id'], set_={c: stmt.excluded[c] for c in ('date', 'type', 'duration_min', 'distance_km', 'source')}))
+    for rows in chunked([{'profile_id': pid, 'date': datetime.combine(d, datetime.min.time()), 'count': c} for d, c in sorted(steps.items())]):
+        stmt = upsert_stmt(Steps).values(rows)
+        db.session.execute(stmt.on_conflict_do_update(index_elements=['profile_id', 'date'], set_={'count': stmt.excluded.count}))
+    # Weigh-ins and resting pulse have no natural key; skip timestamps that are already stored
+    if weights:
+        known = {d for (d,) in db.session.query(WeightEntry.date).filter(WeightEntry.profile_id == pid, WeightEntry.date.between(min(weights), max(weights)))}
+        rows = [w for d, w in sorted(weights.items()) if d not in known]
+        for chunk in chunked(rows): db.session.execute(db.insert(WeightEntry), chunk)
+        weights = {d: w for d, w in weights.items() if d not in known}
+    hr_rows = [{'profile_id': pid, 'date': datetime.combine(d, datetime.min.time()), 'type': 'Ruhepuls', 'value_pulse': bpm} for d, bpm in sorted(heart_rate.items())]
+    if hr_rows:
+        known = {d for (d,) in db.session.query(VitalValue.date).filter(VitalValue.profile_id == pid, VitalValue.type == 'Ruhepuls', VitalValue.date.between(hr_rows[0]['date'], hr_rows[-1]['date']))}
+        hr_rows = [r for r in hr_rows if r['date'] not in known]
+        for chunk in chunked(hr_rows): db.session.execute(db.insert(VitalValue), chunk)
+
+    mark_changed(*[t for t, rows in (('activity', activities), ('steps', steps), ('weight_entry', weights), ('vital_value', hr_rows)) if rows])
+    recompute_rollups(*steps, *weights, *(r['date'] for r in hr_rows))
+    db.session.commit()
+    return {'activities': len(activities), 'steps': len(steps), 'weights': len(weights), 'heart_rate': len(hr_rows)}
+
+@app.route('/import/fit', methods=['POST'])
+def import_fit():
+    # Any number of .fit files and/or zip archives in the multipart field "files"
+    items, skipped = [], []
+    for f in request.files.getlist('files'):
+        name = secure_filename(f.filename or '')
+        if name.lower().endswith('.zip'):
+            try: items.extend(fit_import.read_zip(f.stream))
+            except zipfile.BadZipFile: skipped.append({'file': name, 'error': 'Invalid zip archive'})
+        elif allowed_file(name): items.append((name, f.read()))
+        else: skipped.append({'file': name, 'error': 'Unsupported file type'})
+    if not items and not skipped: return jsonify({'error': 'No files'}), 400
+    results = fit_import.parse_files(items)
+    try: imported = import_fit_results([r for r in results if not r['error']])
+    except Exception as e:
+        db.session.rollback(); return jsonify({'error': str(e)}), 500
+    files = [{'file': r['file'], 'error': r['error'], 'activities': len(r['activities']), 'steps': len(r['steps']),
+              'weights': len(r['weights']), 'heart_rate': len(r['heart_rate'])} for r in results]
+    return jsonify({'files': files + skipped, 'imported': imported})
+
+# --- Batch API ---
+BATCH_LIMIT = 10000
+WEIGHT_METRICS = ('fat_percentage', 'bmi', 'skeletal_muscle', 'muscle_mass', 'protein', 'bmr', 'fat_free_mass', 'subcutaneous_fat', 'visceral_fat', 'body_water', 'bone_mass')
+
+def entry_datetime(e): return parse_datetime_str(e['date'], e.get('time') or '00:00')
+
+def medication_id(e, meds):
+    if e.get('medication_id') is not None: return safe_int(e['medication_id'])
+    if e.get('name') not in meds: raise ValueError(f"Unknown medication: {e.get('name')}")
+    return meds[e['name']]
+
+# Entry type -> (Model, parser); parsers read the to_dict() shape of that type, `meds` maps medication names to ids
+ENTRY_PARSERS = {
+    'lab': (LabValue, lambda e, meds: {'date': parse_date_str(e['date']), 'name': e['name'], 'value': safe_float(e.get('value')), 'unit': e.get('unit') or None, 'min_norm': safe_float(e.get('min_norm')), 'max_norm': safe_float(e.get('max_norm'))}),
+    'vital': (VitalValue, lambda e, meds: {'date': entry_datetime(e), 'type': e.get('kind') or 'Blutdruck/Puls', 'value_sys': safe_int(e.get('sys')), 'value_dia': safe_int(e.get('dia')), 'value_pulse': safe_int(e.get('pulse'))}),
+    'weight': (WeightEntry, lambda e, meds: {'date': entry_datetime(e), 'weight': safe_float(e.get('weight')), **{c: safe_float(e.get(c)) for c in WEIGHT_METRICS}}),
+    'steps': (Steps, lambda e, meds: {'date': parse_date_str(e['date']), 'count': safe_int(e.get('count'))}),
+    'food': (FoodEntry, lambda e, meds: {'date': parse_date_str(e['date']), 'description': e.get('description'), 'calories': safe_int(e.get('calories')), 'protein': safe_float(e.get('protein')), 'carbs': safe_float(e.get('carbs')), 'fat': safe_float(e.get('fat'))}),
+    'activity': (Activity, lambda e, meds: {'date': entry_datetime(e), 'type': e.get('act_type'), 'duration_min': safe_int(e.get('duration')), 'distance_km': safe_float(e.get('distance')), 'source': e.get('source') or 'api', 'garmin_id': e.get('garmin_id')}),
+    'medication': (MedicationEntry, lambda e, meds: {'date': parse_date_str(e['date']), 'medication_id': medication_id(e, meds), 'amount': str(e['amount']) if e.get('amount') not in (None, '') else None}),
+    'mood': (MoodEntry, lambda e, meds: {'date': parse_date_str(e['date']), 'mood_score': safe_int(e.get('mood')), 'energy_score': safe_int(e.get('energy')), 'notes': e.get('notes')}),
+    'water': (WaterEntry, lambda e, meds: {'date': parse_date_str(e['date']).date(), 'amount_ml': safe_int(e.get('amount_ml'))}),
+    'sleep': (SleepEntry, lambda e, meds: {'date': parse_date_str(e['date']).date(), 'duration_hours': safe_float(e.get('duration')), 'quality': safe_int(e.get('quality'))}),
+}
+
+def parse_entry(e, meds):
+    """Column values for one typed entry of the current profile; raises ValueError if it is malformed or misses a required field."""
+    if not isinstance(e, dict) or e.get('type') not in ENTRY_PARSERS: raise ValueError('Invalid type')
+    Model, parse = ENTRY_PARSERS[e['type']]
+    try: row = parse(e, meds)
+    except KeyError as k: raise ValueError(f"Missing {k.args[0]}")
+    except (TypeError, AttributeError): raise ValueError('Invalid value')
+    row['profile_id'] = current_profile_id()
+    missing = [c.name for c in Model.__table__.columns if not c.nullable and not c.primary_key and row.get(c.name) is None]
+    if missing: raise ValueError(f"Missing {', '.join(missing)}")
+    return row
+
+def write_entries(rows_by_type):
+    """Bulk-write parsed rows (no commit). Steps and sleep stay unique per day: later rows replace earlier ones."""
+    counts = {}
+    for t, rows in rows_by_type.items():
+        Model = ENTRY_PARSERS[t][0]
+        if t == 'steps':
+            rows = list({r['date']: r for r in rows}.values())
+            stmt = upsert_stmt(Steps)
+            for chunk in chunked(rows): db.session.execute(stmt.values(chunk).on_conflict_do_update(index_elements=['profile_id', 'date'], set_={'count': stmt.excluded.count}))
+        elif t == 'sleep':
+            rows = list({r['date']: r for r in rows}.values())
+            existing = dict(db.session.query(SleepEntry.date, SleepEntry.id).filter(SleepEntry.profile_id == current_profile_id(), SleepEntry.date.in_([r['date'] for r in rows])))
+            updates = [{'id': existing[r['date']], **r} for r in rows if r['date'] in existing]
+            if updates: db.session.execute(db.update(SleepEntry), updates)
+            inserts = [r for r in rows if r['date'] not in existing]
+            if inserts: db.session.execute(db.insert(SleepEntry), inserts)
+        elif t == 'water':
+            # Summed per day and added to the daily counters, like add_water()
+            totals = {}
+            for r in rows: totals[r['date']] = totals.get(r['date'], 0) + r['amount_ml']
+            stmt = upsert_stmt(WaterEntry)
+            for chunk in chunked([{'profile_id': current_profile_id(), 'date': d, 'amount_ml': ml} for d, ml in totals.items()]):
+                db.session.execute(stmt.values(chunk).on_conflict_do_update(index_elements=['profile_id', 'date'], set_={'amount_ml': WaterEntry.amount_ml + stmt.excluded.amount_ml}))
+        else:
+            db.session.execute(db.insert(Model), rows)
+        counts[t] = len(rows)
+    mark_changed(*(ENTRY_PARSERS[t][0].__tablename__ for t in rows_by_type))
+    mark_changed(*{lab_version_name(r['name']) for r in rows_by_type.get('lab', [])})
+    recompute_rollups(*(r['date'] for rows in rows_by_type.values() for r in rows))
+    return counts
+
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    # JSON array of entries in their to_dict() shape plus "type"; all or nothing, in one transaction
+    entries = request.get_json(silent=True)
+    if isinstance(entries, dict): entries = entries.get('entries')
+    if not isinstance(entries, list) or not entries: return jsonify({'error': 'Expected a JSON array of entries'}), 400
+    if len(entries) > BATCH_LIMIT: return jsonify({'error': f'At most {BATCH_LIMIT} entries per batch'}), 413
+    meds = dict(db.session.query(Medication.name, Medication.id))
+    rows_by_type, errors = {}, []
+    for i, e in enumerate(entries):
+        try: row = parse_entry(e, meds)
+        except ValueError as err: errors.append({'index': i, 'error': str(err)}); continue
+        rows_by_type.setdefault(e['type'], []).append(row)
+    if errors: return jsonify({'error': 'Invalid entries', 'entries': errors[:100]}), 400
+    try:
+        counts = write_entries(rows_by_type); db.session.commit()
+    except Exception as e:
+        db.session.rollback(); return jsonify({'error': str(e)}), 500
+    return jsonify({'written': counts}), 201
+
 @app.route('/get_entry/<string:model_type>/<int:id>')
 def get_entry(model_type, id):
-    model_map = {
-        'lab': LabValue, 'vital': VitalValue, 'weight': WeightEntry, 
-        'steps': Steps, 'food': FoodEntry, 'activity': Activity, 
-        'medication': MedicationEntry, 'sleep': SleepEntry, 'mood': MoodEntry,
-        'marker': Marker, 'med_def': Medication
-    }
-    Model = model_map.get(model_type)
+    Model = MODEL_MAP.get(model_type)
     if not Model: return jsonify({'error': 'Invalid type'}), 400
-    obj = Model.query.get_or_404(id)
+    obj = owned_or_404(Model, id)
     return jsonify(obj.to_dict())
 
+@app.route('/api/<string:model_type>')
+def api_list(model_type):
+    if model_type not in LIST_TYPES: return jsonify({'error': 'Invalid type'}), 400
+    Model = MODEL_MAP[model_type]
+    limit = min(max(safe_int(request.args.get('limit'), PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    ascending = 'after' in request.args or request.args.get('sort') == 'asc'
+    try:
+        rows, next_cursor = keyset_page(Model, request.args.get('after') or request.args.get('before'), limit, ascending)
+    except ValueError: return jsonify({'error': 'Invalid cursor'}), 400
+    items = [r.to_dict() for r in rows]
+    # The lab table draws each value's reference range; to_dict() stays the export layout
+    if Model is LabValue: items = [{**i, 'status': r.range_status, 'range_pos': r.range_pos} for i, r in zip(items, rows)]
+    return jsonify({'items': items, 'next': next_cursor})
+
 @app.route('/edit_entry/<string:model_type>/<int:id>', methods=['POST'])
 def edit_entry(model_type, id):
-    model_map = {
-        'lab': LabValue, 'vital': VitalValue, 'weight': WeightEntry, 
-        'steps': Steps, 'food': FoodEntry, 'activity': Activity, 
-        'medication': MedicationEntry, 'sleep': SleepEntry, 'mood': MoodEntry,
-        'marker': Marker, 'med_def': Medication
-    }
-    Model = model_map.get(model_type)
+    Model = MODEL_MAP.get(model_type)
     if not Model: return redirect(url_for('index'))
-    obj = Model.query.get_or_404(id)
+    obj = owned_or_404(Model, id)
+    old_date = getattr(obj, 'date', None)
     
     if model_type == 'lab':
         obj.date = parse_date_str(request.form['date'])
@@ -470,34 +1092,33 @@ def edit_entry(model_type, id):
         obj.date = parse_date_str(request.form['date'])
         obj.amount = request.form.get('amount_custom') or request.form.get('amount_select')
 
+    refresh_rollups(old_date, getattr(obj, 'date', None))
     db.session.commit(); return redirect(url_for('index'))
 
 @app.route('/delete_entry/<string:model_type>/<int:id>', methods=['POST'])
 def delete_entry(model_type, id):
-    model_map = {
-        'lab': LabValue, 'vital': VitalValue, 'weight': WeightEntry, 
-        'steps': Steps, 'food': FoodEntry, 'activity': Activity, 
-        'marker': Marker, 'medication': MedicationEntry, 'sleep': SleepEntry, 
-        'mood': MoodEntry, 'med_def': Medication
-    }
-    Model = model_map.get(model_type)
-    if Model: db.session.delete(Model.query.get_or_404(id)); db.session.commit()
+    Model = MODEL_MAP.get(model_type)
+    if Model:
+        obj = owned_or_404(Model, id)
+        db.session.delete(obj); refresh_rollups(getattr(obj, 'date', None)); db.session.commit()
     return redirect(url_for('index'))
 
 @app.route('/daily_summary/<string:target_date>')
+@cached_response()
 def daily_summary(target_date):
     try:
         dt = datetime.strptime(target_date, '%Y-%m-%d'); start = datetime.combine(dt, datetime.min.time()); end = datetime.combine(dt, datetime.max.time())
-        weights = WeightEntry.query.filter(WeightEntry.date >= start, WeightEntry.date <= end).all()
-        steps = Steps.query.filter(Steps.date >= start, Steps.date <= end).all()
-        foods = FoodEntry.query.filter(FoodEntry.date >= start, FoodEntry.date <= end).all()
-        vitals = VitalValue.query.filter(VitalValue.date >= start, VitalValue.date <= end).all()
-        activities = Activity.query.filter(Activity.date >= start, Activity.date <= end).all()
-        moods = MoodEntry.query.filter(MoodEntry.date >= start, MoodEntry.date <= end).all()
-        meds = MedicationEntry.query.filter(MedicationEntry.date >= start, MedicationEntry.date <= end).all()
-        labs = LabValue.query.filter(LabValue.date >= start, LabValue.date <= end).all()
-        sleep = SleepEntry.query.filter(SleepEntry.date == dt.date()).first()
-        water_sum = db.session.query(db.func.sum(WaterEntry.amount_ml)).filter(WaterEntry.date == dt.date()).scalar() or 0
+        weights = scoped(WeightEntry).filter(WeightEntry.date >= start, WeightEntry.date <= end).all()
+        steps = scoped(Steps).filter(Steps.date >= start, Steps.date <= end).all()
+        foods = scoped(FoodEntry).filter(FoodEntry.date >= start, FoodEntry.date <= end).all()
+        vitals = scoped(VitalValue).filter(VitalValue.date >= start, VitalValue.date <= end).all()
+        activities = scoped(Activity).filter(Activity.date >= start, Activity.date <= end).all()
+        moods = scoped(MoodEntry).filter(MoodEntry.date >= start, MoodEntry.date <= end).all()
+        meds = scoped(MedicationEntry).filter(MedicationEntry.date >= start, MedicationEntry.date <= end).all()
+        labs = scoped(LabValue).filter(LabValue.date >= start, LabValue.date <= end).all()
+        sleep = scoped(SleepEntry).filter(SleepEntry.date == dt.date()).first()
+        water = scoped(WaterEntry).filter(WaterEntry.date == dt.date()).first()
+        # The view lists all of the day's entries anyway; their totals cost no extra query
         nutrition = {'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0}
         for f in foods:
             nutrition['calories'] += (f.calories or 0); nutrition['protein'] += (f.protein or 0); nutrition['carbs'] += (f.carbs or 0); nutrition['fat'] += (f.fat or 0)
@@ -506,176 +1127,614 @@ def daily_summary(target_date):
             'nutrition_summary': nutrition, 'vitals': [v.to_dict() for v in vitals],
             'activities': [a.to_dict() for a in activities], 'moods': [m.to_dict() for m in moods],
             'meds': [m.to_dict() for m in meds], 'sleep': sleep.to_dict() if sleep else None, 
-            'water': water_sum, 'lab_values': [l.to_dict() for l in labs], 'foods': [f.to_dict() for f in foods]
+            'water': water.amount_ml if water else 0, 'lab_values': [l.to_dict() for l in labs], 'foods': [f.to_dict() for f in foods],
+            'water_events': water.to_dict()['events'] if water else []
         })
     except Exception as e: return jsonify({'error': str(e)}), 400
 
+# --- Lab Trends ---
+LAB_WINDOW = 5
+_lab_series = {}
+
+def lab_version_name(name): return f"lab_value:{name}"
+
+def rolling(values, window):
+    """Trailing mean/std/min/max over up to `window` results, one row per value."""
+    padded = np.concatenate([np.full(window - 1, np.nan), values])
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window)
+    with np.errstate(invalid='ignore'):
+        return np.nanmean(windows, axis=1), np.nanstd(windows, axis=1), np.nanmin(windows, axis=1), np.nanmax(windows, axis=1)
+
+def lab_series(name):
+    """Full series of one marker of the current profile with range flags, deltas and rolling stats; cached until its rows (or the markers) change."""
+    names = (lab_version_name(name), 'marker')
+    versions = dict(db.session.query(DataVersion.name, DataVersion.version).filter(DataVersion.name.in_(names)))
+    key = tuple(versions.get(n) for n in names)
+    pid = current_profile_id()
+    cached = _lab_series.get((pid, name))
+    if cached and cached[0] == key: return cached[1]
+
+    rows = db.session.query(LabValue.id, LabValue.date, LabValue.value, LabValue.unit, LabValue.min_norm, LabValue.max_norm).filter(LabValue.profile_id == pid, LabValue.name == name).order_by(LabValue.date, LabValue.id).all()
+    marker = Marker.query.filter_by(name=name).first()
+    # Rows without their own reference range fall back to the marker's master data
+    lo = np.array([r.min_norm if r.min_norm is not None else (marker.min_norm if marker else None) for r in rows], dtype=float)
+    hi = np.array([r.max_norm if r.max_norm is not None else (marker.max_norm if marker else None) for r in rows], dtype=float)
+    values = np.array([r.value for r in rows], dtype=float)
+    delta = np.concatenate([[np.nan], np.diff(values)])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta_pct = delta / np.concatenate([[np.nan], values[:-1]]) * 100
+        has_range = hi > lo
+        pos = np.clip((values - lo) / (hi - lo) * 50 + 25, 0, 100)
+    status = np.where(values < lo, 'low', np.where(values > hi, 'high', 'ok'))
+    mean, std, low, high = rolling(values, LAB_WINDOW) if len(rows) else ([],) * 4
+
+    def num(x, digits=2): return None if np.isnan(x) else round(float(x), digits)
+    points = [{
+        'id': r.id, 'date': r.date.strftime('%Y-%m-%d'), 'value': r.value, 'unit': r.unit or (marker.unit if marker else '') or '',
+        'min_norm': num(lo[i]), 'max_norm': num(hi[i]),
+        'status': str(status[i]) if has_range[i] else None, 'range_pos': num(pos[i], 1) if has_range[i] else None,
+        'delta': num(delta[i]), 'delta_pct': num(delta_pct[i], 1),
+        'rolling': {'mean': num(mean[i]), 'std': num(std[i]), 'min': num(low[i]), 'max': num(high[i])}
+    } for i, r in enumerate(rows)]
+    series = {'name': name, 'unit': (marker.unit if marker else None) or (points[-1]['unit'] if points else ''), 'count': len(points),
+              'out_of_range': sum(1 for p in points if p['status'] in ('low', 'high')), 'latest': points[-1] if points else None, 'points': points}
+    if rows: _lab_series[(pid, name)] = (key, series)
+    return series
+
+@app.route('/api/labs')
+def labs_api():
+    # One entry per marker name (distinct over the (profile_id, name, date) index) with its latest result
+    names = [n for (n,) in db.session.query(LabValue.name).filter(LabValue.profile_id == current_profile_id()).distinct().order_by(LabValue.name)]
+    return jsonify([{k: v for k, v in lab_series(n).items() if k != 'points'} for n in names])
+
+@app.route('/api/labs/<path:name>')
+def lab_series_api(name):
+    series = lab_series(name)
+    if not series['count']: return jsonify({'error': 'Unknown marker'}), 404
+    return jsonify(series)
+
+# --- Insights ---
+
+def load_rollup_metrics(since=None):
+    q = db.session.query(DailyRollup.date, DailyRollup.updated_at, *(getattr(DailyRollup, m) for m in insights.METRICS)).filter(DailyRollup.profile_id == current_profile_id())
+    if since is not None: q = q.filter(DailyRollup.updated_at > since)
+    return q.all()
+
+@app.route('/api/insights')
+def insights_api():
+    # Lagged correlations, rolling means and weekday patterns over the daily rollups (?lags=0..7&days=N)
+    version = db.session.query(DataVersion.version).filter(DataVersion.name == DailyRollup.__tablename__).scalar()
+    pid = current_profile_id()
+    count = db.session.query(db.func.count(DailyRollup.date)).filter(DailyRollup.profile_id == pid).scalar()
+    result = insights.insights(version, count, load_rollup_metrics, max_lag=min(max(safe_int(request.args.get('lags'), 3), 0), 7), days=min(max(safe_int(request.args.get('days'), 90), 1), 3660), scope=pid)
+    return jsonify(result or {'error': 'No data'}), 200 if result else 404
+
+@app.route('/api/rollup')
+def rollup_api():
+    # Multi-day view (e.g. ?days=7/30/365, or explicit from/to) as one range scan over DailyRollup
+    try:
+        end = parse_date_str(request.args['to']).date() if request.args.get('to') else datetime.now().date()
+        start = parse_date_str(request.args['from']).date() if request.args.get('from') else end - timedelta(days=max(safe_int(request.args.get('days'), 7), 1) - 1)
+    except ValueError: return jsonify({'error': 'Invalid date'}), 400
+    return jsonify([r.to_dict() for r in rollup_range(start, end)])
+
+# Chart series: model, date format and value columns; the first column drives the downsampling
+CHART_METRICS = {
+    'weights': (WeightEntry, '%Y-%m-%d', {'weight': WeightEntry.weight}),
+    'steps': (Steps, '%Y-%m-%d', {'count': Steps.count}),
+    'vitals': (VitalValue, '%Y-%m-%d %H:%M', {'sys': VitalValue.value_sys, 'dia': VitalValue.value_dia, 'pulse': VitalValue.value_pulse}),
+}
+CHART_POINTS = 1000
+MAX_CHART_POINTS = 5000
+
+def chart_series(metric, start=None, end=None, points=CHART_POINTS):
+    """Rows of one chart metric of the current profile within [start, end], reduced to at most `points` with LTTB."""
+    Model, fmt, cols = CHART_METRICS[metric]
+    q = db.session.query(Model.date, *cols.values()).filter(Model.profile_id == current_profile_id()).order_by(Model.date, Model.id)
+    if start: q = q.filter(Model.date >= start)
+    if end: q = q.filter(Model.date <= end)
+    rows = q.all()
+    if len(rows) > points:
+        keep = charts.lttb([r[0].timestamp() for r in rows], [np.nan if r[1] is None else r[1] for r in rows], points)
+        rows = [rows[i] for i in keep]
+    return [{'date': r[0].strftime(fmt), **dict(zip(cols, r[1:]))} for r in rows]
+
 @app.route('/chart_data')
+@cached_response('weight_entry', 'steps', 'vital_value')
 def chart_data():
-    weights = WeightEntry.query.order_by(WeightEntry.date).all()
-    steps = Steps.query.order_by(Steps.date).all()
-    vitals = VitalValue.query.order_by(VitalValue.date).all()
-    return jsonify({
-        'weights': [{'date': w.date.strftime('%Y-%m-%d'), 'weight': w.weight} for w in weights],
-        'steps': [{'date': s.date.strftime('%Y-%m-%d'), 'count': s.count} for s in steps],
-        'vitals': [{'date': v.date.strftime('%Y-%m-%d %H:%M'), 'sys': v.value_sys, 'dia': v.value_dia, 'pulse': v.value_pulse} for v in vitals]
-    })
+    # ?from=&to=&metrics=weights,steps,vitals&points=N; cacheable until one of the charted tables changes
+    metrics = [m for m in request.args.get('metrics', ','.join(CHART_METRICS)).split(',') if m]
+    if not metrics or any(m not in CHART_METRICS for m in metrics): return jsonify({'error': 'Invalid metrics'}), 400
+    try:
+        start = parse_date_str(request.args['from']) if request.args.get('from') else None
+        end = day_bounds(parse_date_str(request.args['to']).date())[1] if request.args.get('to') else None
+    except ValueError: return jsonify({'error': 'Invalid date'}), 400
+    points = min(max(safe_int(request.args.get('points'), CHART_POINTS), 3), MAX_CHART_POINTS)
+
+    tables = sorted(CHART_METRICS[m][0].__tablename__ for m in metrics)
+    versions = db.session.query(DataVersion.version, DataVersion.updated_at).filter(DataVersion.name.in_(tables)).all()
+    pid = current_profile_id()
+    max_ids = [db.session.query(db.func.max(Model.id)).filter(Model.profile_id == pid).scalar() for Model in (CHART_METRICS[m][0] for m in metrics)]
+    etag = hashlib.sha256(json.dumps([pid, tables, [v for v, _ in versions], max_ids, sorted(request.args.items())], default=str).encode()).hexdigest()[:32]
+    stamps = [u for _, u in versions if u]
+    last_modified = max(stamps).astimezone(timezone.utc).replace(microsecond=0) if stamps else None
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        resp = app.response_class(status=304)
+    else:
+        resp = jsonify({m: chart_series(m, start, end, points) for m in metrics})
+    resp.set_etag(etag); resp.last_modified = last_modified
+    resp.cache_control.no_cache = True
+    return resp
+
+# Sections of the JSON export; keys are emitted sorted, matching the former jsonify() output
+EXPORT_SECTIONS = {
+    'lab_values': LabValue, 'weights': WeightEntry, 'steps': Steps, 'vitals': VitalValue,
+    'food': FoodEntry, 'activities': Activity, 'medication_definitions': Medication,
+    'medication_log': MedicationEntry, 'mood': MoodEntry, 'sleep': SleepEntry,
+    'water': WaterEntry, 'markers': Marker
+}
+EXPORT_BATCH = 1000
+
+def stream_rows(Model, batch_size=EXPORT_BATCH):
+    """Yield the current profile's rows of Model (all rows of shared master data) in id order, EXPORT_BATCH at a time from a server-side cursor."""
+    stmt = db.select(Model).order_by(Model.id).execution_options(yield_per=batch_size)
+    if hasattr(Model, 'profile_id'): stmt = stmt.where(Model.profile_id == current_profile_id())
+    if Model is MedicationEntry: stmt = stmt.options(db.joinedload(MedicationEntry.medication))
+    # The identity map only holds weak references, so each batch is freed once it has been serialized
+    for batch in db.session.execute(stmt).scalars().partitions():
+        yield from batch
+
+def generate_export():
+    def dumps(obj): return json.dumps(obj, default=app.json.default, ensure_ascii=app.json.ensure_ascii, sort_keys=True, separators=(',', ':'))
+    profile = current_profile()
+    profile_json = dumps(profile.to_dict() if profile else {})
+    yield '{'
+    for i, key in enumerate(sorted([*EXPORT_SECTIONS, 'profile'])):
+        yield ('' if i == 0 else ',') + dumps(key) + ':'
+        if key == 'profile': yield profile_json; continue
+        yield '['
+        first = True
+        for row in stream_rows(EXPORT_SECTIONS[key]):
+            yield ('' if first else ',') + dumps(row.to_dict()); first = False
+        yield ']'
+    yield '}\n'
 
 @app.route('/export')
 def export_data():
-    data = {
-        'lab_values': [l.to_dict() for l in LabValue.query.all()],
-        'weights': [w.to_dict() for w in WeightEntry.query.all()],
-        'steps': [s.to_dict() for s in Steps.query.all()],
-        'vitals': [v.to_dict() for v in VitalValue.query.all()],
-        'food': [f.to_dict() for f in FoodEntry.query.all()],
-        'activities': [a.to_dict() for a in Activity.query.all()],
-        'medication_definitions': [m.to_dict() for m in Medication.query.all()],
-        'medication_log': [m.to_dict() for m in MedicationEntry.query.all()],
-        'mood': [m.to_dict() for m in MoodEntry.query.all()],
-        'sleep': [s.to_dict() for s in SleepEntry.query.all()],
-        'water': [w.to_dict() for w in WaterEntry.query.all()],
-        'profile': Profile.query.first().to_dict() if Profile.query.first() else {},
-        'markers': [m.to_dict() for m in Marker.query.all()]
-    }
-    res = jsonify(data)
+    res = app.response_class(stream_with_context(generate_export()), mimetype='application/json')
     res.headers['Content-Disposition'] = 'attachment; filename=health_export.json'
     return res
 
+# --- Restore ---
+RESTORE_BATCH = 5000
+# Export sections holding entries, by their ENTRY_PARSERS type; markers, medications and the profile are master data
+RESTORE_SECTIONS = {
+    'lab_values': 'lab', 'weights': 'weight', 'steps': 'steps', 'vitals': 'vital', 'food': 'food', 'activities': 'activity',
+    'medication_log': 'medication', 'mood': 'mood', 'sleep': 'sleep', 'water': 'water'
+}
+
+def restore_medication(meds, name, unit=None, common_dose=None):
+    if name not in meds:
+        m = Medication(name=name, unit=unit or None, common_dose=common_dose or None)
+        db.session.add(m); db.session.flush(); meds[name] = m.id
+    return meds[name]
+
+def restore_export(stream, replace=False, progress=None):
+    """Load a health_export.json from a binary stream into the current profile; returns the rows restored per section.
+
+    Rows are parsed one at a time (restore.read_export) and inserted RESTORE_BATCH at a time, so memory use
+    does not grow with the file; `progress(rows_so_far)` is called after every batch. Everything, including the
+    deletion with `replace`, happens in one transaction: a row that fails to parse leaves the profile as it was.
+    Without `replace` the profile must have no entries. Markers and medications are shared by all profiles: those
+    of the export that are missing are created, as are medications named in the log but missing from the
+    definitions. Water rows are merged per day (older exports hold one row per glass). Rollups are rebuilt at the end.
+    """
+    pid = current_profile_id()
+    models = [m for m in EXPORT_SECTIONS.values() if hasattr(m, 'profile_id')]
+    try:
+        if replace:
+            lab_names = {lab_version_name(n) for (n,) in scoped(LabValue).with_entities(LabValue.name).distinct()}
+            for Model in [*models, DailyRollup]: scoped(Model).delete()
+            mark_changed(*(m.__tablename__ for m in models), *lab_names)
+        elif any(scoped(Model).with_entities(Model.id).first() for Model in models):
+            raise ValueError('The profile already contains data; restore with replace to overwrite it')
+        meds, markers = dict(db.session.query(Medication.name, Medication.id)), {n for (n,) in db.session.query(Marker.name)}
+        counts, pending, water = {}, {}, {}
+
+        def flush():
+            for t, rows in pending.items():
+                for chunk in chunked(rows): db.session.execute(db.insert(ENTRY_PARSERS[t][0]), chunk)
+                mark_changed(ENTRY_PARSERS[t][0].__tablename__)
+            mark_changed(*{lab_version_name(r['name']) for r in pending.get('lab', [])})
+            pending.clear()
+            if progress: progress(sum(counts.values()))
+
+        for section, e in restore.read_export(stream):
+            if section == 'profile':
+                p = current_profile()
+                if e.get('name') and not p.name: p.name = e['name']
+                p.height_cm, p.target_weight = safe_float(e.get('height_cm')), safe_float(e.get('target_weight'))
+                p.birthdate = parse_date_str(e['birthdate']).date() if e.get('birthdate') else None
+                counts['profile'] = 1; continue
+            if not isinstance(e, dict): raise ValueError(f"Invalid row in {section}")
+            if section == 'markers':
+                if e['name'] in markers: continue
+                markers.add(e['name'])
+                db.session.add(Marker(name=e['name'], unit=e.get('unit') or None, min_norm=safe_float(e.get('min_norm')), max_norm=safe_float(e.get('max_norm'))))
+            elif section == 'medication_definitions':
+                restore_medication(meds, e['name'], e.get('unit'), e.get('common_dose'))
+            elif section in RESTORE_SECTIONS:
+                t = RESTORE_SECTIONS[section]
+                if t == 'medication' and e.get('name'): restore_medication(meds, e['name'], e.get('unit'))
+                try: row = parse_entry({**e, 'type': t}, meds)
+                except ValueError as err: raise ValueError(f"Invalid row {counts.get(section, 0) + 1} in {section}: {err}")
+                if t == 'water':
+                    # One row per day is unique now; at most one per day of history is held until the end
+                    day = water.setdefault(row['date'], {**row, 'amount_ml': 0, 'events': []})
+                    day['amount_ml'] += row['amount_ml'] or 0; day['events'] += e.get('events') or []
+                else: pending.setdefault(t, []).append(row)
+            else: continue
+            counts[section] = counts.get(section, 0) + 1
+            if sum(len(rows) for rows in pending.values()) >= RESTORE_BATCH: flush()
+        if water: pending['water'] = [{**w, 'events': json.dumps(w['events']) if w['events'] else None} for w in water.values()]
+        flush()
+        rebuild_rollups(pid) # commits the whole restore
+    except Exception:
+        db.session.rollback(); raise
+    return counts
+
+@app.route('/import/json', methods=['POST'])
+def import_json():
+    # A health_export.json in the multipart field "file", restored into the current profile; ?replace=1 deletes its existing entries first
+    f = request.files.get('file')
+    if not f: return jsonify({'error': 'No file'}), 400
+    try: counts = restore_export(f.stream, replace=request.args.get('replace') == '1')
+    except (ValueError, KeyError) as e:
+        db.session.rollback(); return jsonify({'error': str(e) if isinstance(e, ValueError) else f"Missing {e.args[0]}"}), 400
+    except Exception as e:
+        db.session.rollback(); return jsonify({'error': str(e)}), 500
+    return jsonify({'restored': counts}), 201
+
+@app.cli.command('restore')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--replace', is_flag=True, help="Delete the profile's existing entries first.")
+@click.option('--profile', 'profile_id', type=int, help='Profile id to restore into (default: the first profile).')
+def restore_command(path, replace, profile_id):
+    """Load a health_export.json (from /export) into a profile."""
+    if profile_id is not None:
+        if profile_id not in profiles(): raise click.BadParameter(f"no profile {profile_id}", param_hint='--profile')
+        g.profile_id = profile_id
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        counts = restore_export(f, replace, progress=lambda n: print(f"\r{n} rows restored", end='', flush=True))
+    print(f"\nRestored {sum(counts.values())} rows in {time.perf_counter() - started:.1f} s: " + ', '.join(f"{k} {v}" for k, v in sorted(counts.items())))
+
+# --- Search ---
+# The search index (SQLite FTS5 table and triggers, Postgres GIN indexes) is created along with the tables
+db.event.listen(db.metadata, 'after_create', lambda target, connection, **kw: search.create(connection))
+_search_indexed = None
+
+@app.route('/api/search')
+@cached_response(*(table for table, _ in search.SOURCES.values()))
+def api_search():
+    # ?q=words (each a prefix) &from=&to=YYYY-MM-DD &type=food,mood,lab,activity &limit=50
+    global _search_indexed
+    q = request.args.get('q', '')
+    if not search.tokens(q): return jsonify({'error': 'Missing query'}), 400
+    try:
+        start = parse_date_str(request.args['from']) if request.args.get('from') else None
+        end = parse_date_str(request.args['to']) + timedelta(days=1) if request.args.get('to') else None
+    except ValueError: return jsonify({'error': 'Invalid date'}), 400
+    conn = db.session.connection()
+    if _search_indexed is None: _search_indexed = search.has_index(conn)
+    kinds = request.args['type'].split(',') if request.args.get('type') else None
+    return jsonify({'items': search.search(conn, q, start, end, kinds, safe_int(request.args.get('limit'), 50), indexed=_search_indexed, profile_id=current_profile_id())})
+
+# --- Food Catalog ---
+# Autocomplete and "log again" for the food form, answered from memory (see catalog.py), one catalog per profile.
+# Commits made through the ORM update the catalogs directly; other writes (batch API, restore, other workers) bump the
+# food_entry counter of the response cache and are caught up on the next lookup, as are writes outside the app after
+# RESPONSE_CACHE_TTL.
+food_catalogs = {} # profile id -> FoodCatalog
+_food_catalog_sync = threading.Lock()
+FOOD_COLUMNS = (FoodEntry.id, FoodEntry.date, FoodEntry.description, FoodEntry.calories, FoodEntry.protein, FoodEntry.carbs, FoodEntry.fat)
+
+def food_row(obj): return tuple(getattr(obj, c.key) for c in FOOD_COLUMNS)
+
+def food_catalog_version():
+    return json.loads(response_cache.store.versions([FoodEntry.__tablename__]))[0]
+
+def sync_food_catalog():
+    """The current profile's catalog, caught up with the food entries."""
+    pid = current_profile_id()
+    food_catalog = food_catalogs.setdefault(pid, catalog.FoodCatalog())
+    version, now = food_catalog_version(), time.time()
+    if food_catalog.version == version and now - food_catalog.synced_at < response_cache.ttl: return food_catalog
+    # One thread catches up; the others answer from the current contents meanwhile (or wait for the first load)
+    if not _food_catalog_sync.acquire(blocking=food_catalog.version is None): return food_catalog
+    try:
+        if food_catalog.version == version and now - food_catalog.synced_at < response_cache.ttl: return food_catalog
+        q = db.session.query(*FOOD_COLUMNS).filter(FoodEntry.profile_id == pid)
+        if food_catalog.version is not None and food_catalog.version != version:
+            # Usually only new rows: take them if they explain the row count, otherwise reload everything.
+            # Filtered by profile here, so the database reads the id range instead of the profile's whole index
+            new = [r[1:] for r in db.session.query(FoodEntry.profile_id, *FOOD_COLUMNS).filter(FoodEntry.id > food_catalog.max_id) if r[0] == pid]
+            if db.session.query(db.func.count(FoodEntry.id)).filter(FoodEntry.profile_id == pid).scalar() == len(food_catalog.rows) + len(new):
+                food_catalog.update(new, version)
+                return food_catalog
+        food_catalog.load(q.yield_per(EXPORT_BATCH), version, now)
+        return food_catalog
+    finally: _food_catalog_sync.release()
+
+@db.event.listens_for(db.session, 'after_flush')
+def _collect_food_changes(session, flush_context):
+    changes = session.info.setdefault('food_changes', {})
+    for obj in [*session.new, *session.dirty]:
+        if isinstance(obj, FoodEntry): changes[obj.profile_id, obj.id] = food_row(obj)
+    for obj in session.deleted:
+        if isinstance(obj, FoodEntry): changes[obj.profile_id, obj.id] = None
+
+@db.event.listens_for(db.session, 'after_commit')
+def _apply_food_changes(session):
+    # Runs after _invalidate_response_cache bumped the counter; a catalog only moves to the new version
+    # if it was current before this commit, otherwise its next lookup catches up
+    changes = session.info.pop('food_changes', None)
+    if not changes: return
+    version = food_catalog_version()
+    for pid, food_catalog in list(food_catalogs.items()):
+        with food_catalog.lock:
+            for (owner, id), row in changes.items():
+                if owner != pid: continue
+                if row: food_catalog.upsert(row)
+                else: food_catalog.remove(id)
+            if food_catalog.version == version - 1: food_catalog.version = version
+
+@db.event.listens_for(db.session, 'after_rollback')
+def _discard_food_changes(session):
+    session.info.pop('food_changes', None)
+
+@app.route('/api/foods')
+def food_suggestions():
+    # ?q=beginnings of words (empty: most logged) &limit=10
+    food_catalog = sync_food_catalog()
+    limit = min(max(safe_int(request.args.get('limit'), catalog.LIMIT), 1), catalog.MAX_LIMIT)
+    return jsonify({'items': food_catalog.suggest(request.args.get('q', ''), limit)})
+
+@app.route('/api/foods/log', methods=['POST'])
+def log_food_again():
+    # description of a catalog item (any case), optional date YYYY-MM-DD (default today); the macros are those it was last logged with
+    data = request.get_json(silent=True) or request.form
+    item = sync_food_catalog().item(data.get('description'))
+    if not item: return jsonify({'error': 'Unknown food'}), 404
+    try: d = parse_date_str(data.get('date') or datetime.now().strftime('%Y-%m-%d'))
+    except ValueError: return jsonify({'error': 'Invalid date'}), 400
+    entry = FoodEntry(profile_id=current_profile_id(), date=d, description=item['description'], calories=item['calories'], protein=item['protein'], carbs=item['carbs'], fat=item['fat'])
+    db.session.add(entry); refresh_rollups(entry.date)
+    db.session.commit()
+    return jsonify(entry.to_dict()), 201
+
+# --- Columnar Export ---
+COLUMNAR_BATCH = 50000
+COLUMNAR_MODELS = [*EXPORT_SECTIONS.values(), Profile, DailyRollup]
+
+def table_batches(table, batch_size=COLUMNAR_BATCH):
+    """Yield the current profile's raw rows of a table in primary-key order, batch_size at a time from a server-side cursor."""
+    stmt = db.select(*table.columns).order_by(*table.primary_key.columns).execution_options(yield_per=batch_size)
+    if 'profile_id' in table.c: stmt = stmt.where(table.c.profile_id == current_profile_id())
+    elif table is Profile.__table__: stmt = stmt.where(table.c.id == current_profile_id())
+    yield from db.session.execute(stmt).partitions()
+
+def write_columnar_export(open_file, fmt='parquet'):
+    """Write every table (the current profile's rows) through open_file(filename) as one typed file (see columnar); returns the rows per table."""
+    counts = {}
+    for Model in COLUMNAR_MODELS:
+        table = Model.__table__
+        with open_file(table.name + columnar.FORMATS[fmt]) as out: counts[table.name] = columnar.write_table(out, table, table_batches(table), fmt)
+    return counts
+
+@app.route('/export/columnar')
+def export_columnar():
+    # ?format=parquet (default) or arrow; a zip with one file per table
+    fmt = request.args.get('format', 'parquet')
+    if fmt not in columnar.FORMATS: return jsonify({'error': f"Unknown format, expected one of {', '.join(columnar.FORMATS)}"}), 400
+    buf = tempfile.TemporaryFile() # the archive is spooled to disk, so its size does not count against the worker
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_STORED) as zf: # the files are compressed already
+        write_columnar_export(lambda name: zf.open(name, 'w', force_zip64=True), fmt)
+    buf.seek(0)
+    return send_file(buf, mimetype='application/zip', as_attachment=True, download_name=f"health_export_{fmt}.zip")
+
+@app.cli.command('export-columnar')
+@click.argument('directory', type=click.Path(file_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(list(columnar.FORMATS)), default='parquet', show_default=True)
+def export_columnar_command(directory, fmt):
+    """Write every table of the first profile as a typed Parquet or Arrow file into DIRECTORY."""
+    os.makedirs(directory, exist_ok=True)
+    started = time.perf_counter()
+    counts = write_columnar_export(lambda name: open(os.path.join(directory, name), 'wb'), fmt)
+    print(f"Wrote {sum(counts.values())} rows in {time.perf_counter() - started:.1f} s to {directory}: " + ', '.join(f"{k} {v}" for k, v in sorted(counts.items())))
+
+def place_raster(pdf, raster, x=None, y=None, w=0, h=0):
+    """Place an in-memory RGB raster from charts.render_chart(); fpdf itself only reads image files."""
+    name = f"raster-{len(pdf.images) + 1}"
+    pdf.images[name] = {'i': len(pdf.images) + 1, 'w': raster['w'], 'h': raster['h'], 'cs': 'DeviceRGB', 'bpc': 8, 'f': 'FlateDecode', 'data': raster['data']}
+    pdf.image(name, x=x, y=y, w=w, h=h)
+
+def build_report_pdf():
+    """Render the full health report of the current profile and return the PDF bytes."""
+    from fpdf import FPDF # imported by the report threads only, so web workers and migrate.py start without it
+    pdf = FPDF(); pdf.set_margins(10, 10, 10); pdf.add_page(); pdf.set_auto_page_break(auto=True, margin=15); w = 190
+    def clean(s): return str(s).encode('latin-1', 'replace').decode('latin-1') if s else ""
+    profile = current_profile()
+    pdf.set_font("Arial", 'B', 20); pdf.cell(w, 15, txt=clean("Gesundheitsbericht"), ln=1, align='C')
+    if len(profiles()) > 1: pdf.set_font("Arial", '', 12); pdf.cell(w, 8, txt=clean(profile.label), ln=1, align='C')
+    data_by_date = {}
+    def add(d_obj, text, cat):
+        d_str = d_obj.strftime('%Y-%m-%d'); 
+        if d_str not in data_by_date: data_by_date[d_str] = []
+        data_by_date[d_str].append({'text': clean(text), 'time': d_obj.strftime('%H:%M') if hasattr(d_obj, 'strftime') else "00:00"})
+    for x in scoped(LabValue).all(): add(x.date, f"Labor: {x.name}={x.value}{x.unit}", "L")
+    for x in scoped(VitalValue).all(): add(x.date, f"Vital: {x.value_sys}/{x.value_dia} Puls:{x.value_pulse}", "V")
+    for x in scoped(WeightEntry).all(): 
+        details = [f"Gewicht: {x.weight}kg"]
+        if x.fat_percentage: details.append(f"Fett: {x.fat_percentage}%")
+        if x.bmi: details.append(f"BMI: {x.bmi}")
+        if x.skeletal_muscle: details.append(f"Skelettmuskeln: {x.skeletal_muscle}%")
+        if x.muscle_mass: details.append(f"Muskelmasse: {x.muscle_mass}kg")
+        if x.protein: details.append(f"Protein: {x.protein}%")
+        if x.bmr: details.append(f"Grundumsatz: {x.bmr}kcal")
+        if x.fat_free_mass: details.append(f"Fettfreie Masse: {x.fat_free_mass}kg")
+        if x.subcutaneous_fat: details.append(f"Subkutanes Fett: {x.subcutaneous_fat}%")
+        if x.visceral_fat: details.append(f"Viszerales Fett: {x.visceral_fat}")
+        if x.body_water: details.append(f"Körperwasser: {x.body_water}%")
+        if x.bone_mass: details.append(f"Knochenmasse: {x.bone_mass}kg")
+        add(x.date, " | ".join(details), "W")
+    for x in scoped(Steps).all(): add(x.date, f"Schritte: {x.count}", "S")
+    for x in scoped(MoodEntry).all(): add(x.date, f"Mood: {x.mood_score}/10", "M")
+    for x in scoped(SleepEntry).all(): add(datetime.combine(x.date, datetime.min.time()), f"Schlaf: {x.duration_hours}h", "SL")
+    
+    # Add food entries to PDF
+    for x in scoped(FoodEntry).all():
+        macro_str = f"P:{x.protein or 0}g C:{x.carbs or 0}g F:{x.fat or 0}g"
+        add(x.date, f"Essen: {x.description} ({x.calories or 0}kcal, {macro_str})", "F")
+
+    # Weight loss stats for PDF
+    stats = weight_loss_stats(profile)
+    if stats:
+        duration_str = f" (in {stats['days_to_go']} Tagen)" if stats['days_to_go'] is not None else ""
+        pdf.set_font("Arial", 'B', 14); pdf.cell(w, 10, txt=clean("Gewichts-Statistik"), ln=1)
+        pdf.set_font("Arial", '', 12)
+        pdf.cell(w, 8, txt=clean(f"Bereits verloren: {stats['lost_so_far']} kg"), ln=1)
+        pdf.cell(w, 8, txt=clean(f"Noch zu verlieren: {stats['remaining']} kg"), ln=1)
+        pdf.cell(w, 8, txt=clean(f"Zielgewicht: {profile.target_weight} kg"), ln=1)
+        pdf.cell(w, 8, txt=clean(f"Voraussichtliches Ziel-Datum: {stats['est_date']}{duration_str}"), ln=1)
+        if stats['est_early']: pdf.cell(w, 8, txt=clean(f"Zeitraum (95%): {stats['est_early']} bis {stats['est_late'] or 'offen'}"), ln=1)
+        pdf.ln(5)
+
+    for d_str in sorted(data_by_date.keys(), reverse=True):
+        pdf.set_fill_color(230, 230, 230); pdf.set_font("Arial", 'B', 12); pdf.cell(w, 10, txt=clean(d_str), ln=1, fill=True); pdf.set_font("Arial", '', 10)
+        for e in sorted(data_by_date[d_str], key=lambda x: x['time']): pdf.multi_cell(w, 6, txt=f"[{e['time']}] {e['text']}")
+    
+    # --- Add Graphs Page ---
+    pdf.add_page()
+    pdf.set_font("Arial", 'B', 16)
+    pdf.cell(w, 15, txt=clean("Grafische Auswertungen"), ln=1, align='C')
+    
+    # Build all chart specs first so the rasters render concurrently (and are reused when unchanged)
+    weights_all = scoped(WeightEntry).with_entities(WeightEntry.date, WeightEntry.weight).order_by(WeightEntry.date).all()
+    vitals_all = scoped(VitalValue).order_by(VitalValue.date).all()
+    steps_all = scoped(Steps).order_by(Steps.date).all()
+    specs = []
+    if weights_all:
+        specs.append(charts.chart_spec('line', "Gewichtsverlauf", 'kg', [x.date for x in weights_all], [{'values': [x.weight for x in weights_all], 'color': '#3498db', 'marker': 'o'}]))
+    if vitals_all:
+        specs.append(charts.chart_spec('line', "Blutdruckverlauf", 'mmHg', [x.date for x in vitals_all], [
+            {'values': [x.value_sys for x in vitals_all], 'color': '#ff6b6b', 'label': 'Sys'},
+            {'values': [x.value_dia for x in vitals_all], 'color': '#3498db', 'label': 'Dia'}]))
+    if steps_all:
+        specs.append(charts.chart_spec('bar', "Schritte (Täglich)", 'Schritte', [x.date for x in steps_all], [{'values': [x.count for x in steps_all], 'color': '#f1c40f'}]))
+    for i, raster in enumerate(charts.render_charts(specs)):
+        place_raster(pdf, raster, x=15, w=180)
+        if i < len(specs) - 1: pdf.ln(5)
+
+    pdf_output = pdf.output(dest='S')
+    if isinstance(pdf_output, str): pdf_output = pdf_output.encode('latin-1')
+    return pdf_output
+
+# --- Report Jobs ---
+# Reports are rendered in a background pool and cached on the export volume under a key derived
+# from the data fingerprint (which includes the profile, and the day, since the report projects from today), so an unchanged
+# dataset is served from disk for the rest of the day. Job state lives in marker files next to the PDF, which makes it visible
+# to every gunicorn worker.
+
+REPORT_KEY_RE = re.compile(r'^[0-9a-f]{64}$')
+report_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('REPORT_WORKERS', 2)), thread_name_prefix='report')
+
+def report_path(key, suffix='.pdf'):
+    return os.path.join(app.config['REPORT_FOLDER'], key + suffix)
+
+def report_status(key):
+    if os.path.exists(report_path(key)): return 'done'
+    if os.path.exists(report_path(key, '.error')): return 'failed'
+    pending = report_path(key, '.pending')
+    if os.path.exists(pending) and time.time() - os.path.getmtime(pending) < app.config['REPORT_TIMEOUT']: return 'running'
+    return 'unknown'
+
+def write_report(key):
+    tmp = report_path(key, f'.{os.getpid()}.{threading.get_ident()}.tmp')
+    with open(tmp, 'wb') as f: f.write(build_report_pdf())
+    os.replace(tmp, report_path(key)) # atomic, so readers never see a partial PDF
+    prune_reports()
+
+def render_report(key, profile_id):
+    with app.app_context():
+        g.profile_id = profile_id
+        try:
+            write_report(key)
+        except Exception as e:
+            with open(report_path(key, '.error'), 'w') as f: f.write(str(e))
+            prune_reports()
+        finally:
+            if os.path.exists(report_path(key, '.pending')): os.remove(report_path(key, '.pending'))
+
+def start_report():
+    """Return (key, status), submitting a render unless the PDF is cached or already in progress."""
+    key = data_fingerprint()
+    status = report_status(key)
+    if status in ('done', 'running'): return key, status
+    if os.path.exists(report_path(key, '.error')): os.remove(report_path(key, '.error'))
+    pending = report_path(key, '.pending')
+    if os.path.exists(pending): os.remove(pending) # stale claim from a crashed worker
+    try: os.close(os.open(pending, os.O_CREAT | os.O_EXCL | os.O_WRONLY)) # claim the job across workers
+    except FileExistsError: return key, 'running'
+    report_executor.submit(render_report, key, current_profile_id())
+    return key, 'running'
+
+def prune_reports():
+    """Keep the newest REPORT_CACHE_SIZE PDFs; failures only until their job would have timed out (clients have stopped polling)."""
+    folder = app.config['REPORT_FOLDER']
+    pdfs = sorted((os.path.join(folder, f) for f in os.listdir(folder) if f.endswith('.pdf')), key=os.path.getmtime, reverse=True)
+    errors = [os.path.join(folder, f) for f in os.listdir(folder) if f.endswith('.error')]
+    expired = [path for path in errors if time.time() - os.path.getmtime(path) > app.config['REPORT_TIMEOUT']]
+    for path in pdfs[app.config['REPORT_CACHE_SIZE']:] + expired:
+        try: os.remove(path)
+        except FileNotFoundError: pass # another worker pruned it first
+
+def report_json(key, status):
+    res = {'id': key, 'status': status, 'status_url': url_for('report_job', key=key)}
+    if status == 'done': res['download_url'] = url_for('report_download', key=key)
+    if status == 'failed':
+        with open(report_path(key, '.error')) as f: res['error'] = f.read()
+    return res
+
+@app.route('/reports', methods=['POST'])
+def create_report():
+    key, status = start_report()
+    return jsonify(report_json(key, status)), 200 if status == 'done' else 202
+
+@app.route('/reports/<string:key>')
+def report_job(key):
+    if not REPORT_KEY_RE.match(key): return jsonify({'error': 'Invalid report id'}), 400
+    status = report_status(key)
+    return jsonify(report_json(key, status)), 404 if status == 'unknown' else 200
+
+@app.route('/reports/<string:key>/pdf')
+def report_download(key):
+    if not REPORT_KEY_RE.match(key) or report_status(key) != 'done': return jsonify({'error': 'Report not ready'}), 404
+    return send_file(os.path.abspath(report_path(key)), mimetype='application/pdf', as_attachment=True, download_name='report.pdf')
+
 @app.route('/pdf')
 def generate_pdf():
+    # Synchronous variant for clients without JavaScript; still served from the report cache
     try:
-        pdf = FPDF(); pdf.set_margins(10, 10, 10); pdf.add_page(); pdf.set_auto_page_break(auto=True, margin=15); w = 190
-        def clean(s): return str(s).encode('latin-1', 'replace').decode('latin-1') if s else ""
-        pdf.set_font("Arial", 'B', 20); pdf.cell(w, 15, txt=clean("Gesundheitsbericht"), ln=1, align='C')
-        data_by_date = {}
-        def add(d_obj, text, cat):
-            d_str = d_obj.strftime('%Y-%m-%d'); 
-            if d_str not in data_by_date: data_by_date[d_str] = []
-            data_by_date[d_str].append({'text': clean(text), 'time': d_obj.strftime('%H:%M') if hasattr(d_obj, 'strftime') else "00:00"})
-        for x in LabValue.query.all(): add(x.date, f"Labor: {x.name}={x.value}{x.unit}", "L")
-        for x in VitalValue.query.all(): add(x.date, f"Vital: {x.value_sys}/{x.value_dia} Puls:{x.value_pulse}", "V")
-        for x in WeightEntry.query.all(): 
-            details = [f"Gewicht: {x.weight}kg"]
-            if x.fat_percentage: details.append(f"Fett: {x.fat_percentage}%")
-            if x.bmi: details.append(f"BMI: {x.bmi}")
-            if x.skeletal_muscle: details.append(f"Skelettmuskeln: {x.skeletal_muscle}%")
-            if x.muscle_mass: details.append(f"Muskelmasse: {x.muscle_mass}kg")
-            if x.protein: details.append(f"Protein: {x.protein}%")
-            if x.bmr: details.append(f"Grundumsatz: {x.bmr}kcal")
-            if x.fat_free_mass: details.append(f"Fettfreie Masse: {x.fat_free_mass}kg")
-            if x.subcutaneous_fat: details.append(f"Subkutanes Fett: {x.subcutaneous_fat}%")
-            if x.visceral_fat: details.append(f"Viszerales Fett: {x.visceral_fat}")
-            if x.body_water: details.append(f"Körperwasser: {x.body_water}%")
-            if x.bone_mass: details.append(f"Knochenmasse: {x.bone_mass}kg")
-            add(x.date, " | ".join(details), "W")
-        for x in Steps.query.all(): add(x.date, f"Schritte: {x.count}", "S")
-        for x in MoodEntry.query.all(): add(x.date, f"Mood: {x.mood_score}/10", "M")
-        for x in SleepEntry.query.all(): add(datetime.combine(x.date, datetime.min.time()), f"Schlaf: {x.duration_hours}h", "SL")
-        
-        # Add food entries to PDF
-        for x in FoodEntry.query.all():
-            macro_str = f"P:{x.protein or 0}g C:{x.carbs or 0}g F:{x.fat or 0}g"
-            add(x.date, f"Essen: {x.description} ({x.calories or 0}kcal, {macro_str})", "F")
-
-        # Weight loss stats for PDF
-        profile = Profile.query.first()
-        weights_all = WeightEntry.query.order_by(WeightEntry.date).all()
-        if weights_all and profile and getattr(profile, 'target_weight', None):
-            first_w_ever = weights_all[0]
-            last_w = weights_all[-1]
-            lost = first_w_ever.weight - last_w.weight
-            rem = last_w.weight - profile.target_weight
-            
-            # Use 30 day window for rate
-            now_dt = datetime.now()
-            thirty_days_ago = now_dt - pd.Timedelta(days=30)
-            recent = [w for w in weights_all if w.date >= thirty_days_ago]
-            
-            if len(recent) >= 2 and (recent[-1].date - recent[0].date).days >= 7:
-                rate_weights = recent
-            else:
-                rate_weights = weights_all
-
-            days_diff = (rate_weights[-1].date - rate_weights[0].date).days
-            weight_diff = rate_weights[0].weight - rate_weights[-1].weight
-            
-            est_str = "N/A"
-            duration_str = ""
-            if days_diff > 0:
-                rate = weight_diff / days_diff
-                if rate > 0:
-                    days_to_go = int(rem / rate)
-                    est_date = now_dt + pd.Timedelta(days=days_to_go)
-                    est_str = est_date.strftime('%d.%m.%Y')
-                    duration_str = f" (in {days_to_go} Tagen)"
-            
-            pdf.set_font("Arial", 'B', 14); pdf.cell(w, 10, txt=clean("Gewichts-Statistik"), ln=1)
-            pdf.set_font("Arial", '', 12)
-            pdf.cell(w, 8, txt=clean(f"Bereits verloren: {round(lost, 1)} kg"), ln=1)
-            pdf.cell(w, 8, txt=clean(f"Noch zu verlieren: {round(rem, 1)} kg"), ln=1)
-            pdf.cell(w, 8, txt=clean(f"Zielgewicht: {profile.target_weight} kg"), ln=1)
-            pdf.cell(w, 8, txt=clean(f"Voraussichtliches Ziel-Datum: {est_str}{duration_str}"), ln=1)
-            pdf.ln(5)
-
-        for d_str in sorted(data_by_date.keys(), reverse=True):
-            pdf.set_fill_color(230, 230, 230); pdf.set_font("Arial", 'B', 12); pdf.cell(w, 10, txt=clean(d_str), ln=1, fill=True); pdf.set_font("Arial", '', 10)
-            for e in sorted(data_by_date[d_str], key=lambda x: x['time']): pdf.multi_cell(w, 6, txt=f"[{e['time']}] {e['text']}")
-        
-        # --- Add Graphs Page ---
-        pdf.add_page()
-        pdf.set_font("Arial", 'B', 16)
-        pdf.cell(w, 15, txt=clean("Grafische Auswertungen"), ln=1, align='C')
-        
-        import tempfile
-        
-        def add_graph(plt_func, title):
-            plt.figure(figsize=(8, 4))
-            plt_func()
-            plt.title(title)
-            plt.grid(True, alpha=0.3)
-            plt.tight_layout()
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp:
-                plt.savefig(tmp.name, format='png', dpi=150)
-                plt.close()
-                pdf.image(tmp.name, x=15, w=180)
-                os.unlink(tmp.name)
-
-        # Weight Graph
-        if weights_all:
-            def plot_weight():
-                plt.plot([x.date for x in weights_all], [x.weight for x in weights_all], marker='o', color='#3498db')
-                plt.ylabel('kg')
-            add_graph(plot_weight, "Gewichtsverlauf")
-            pdf.ln(5)
-
-        # Blood Pressure Graph
-        vitals_all = VitalValue.query.order_by(VitalValue.date).all()
-        if vitals_all:
-            def plot_vitals():
-                dates = [x.date for x in vitals_all]
-                plt.plot(dates, [x.value_sys for x in vitals_all], label='Sys', color='#ff6b6b')
-                plt.plot(dates, [x.value_dia for x in vitals_all], label='Dia', color='#3498db')
-                plt.legend()
-                plt.ylabel('mmHg')
-            add_graph(plot_vitals, "Blutdruckverlauf")
-            pdf.ln(5)
-
-        # Steps Graph
-        steps_all = Steps.query.order_by(Steps.date).all()
-        if steps_all:
-            def plot_steps():
-                plt.bar([x.date for x in steps_all], [x.count for x in steps_all], color='#f1c40f')
-                plt.ylabel('Schritte')
-            add_graph(plot_steps, "Schritte (Täglich)")
-
-        pdf_output = pdf.output(dest='S')
-        if isinstance(pdf_output, str): pdf_output = pdf_output.encode('latin-1')
-        return send_file(io.BytesIO(pdf_output), mimetype='application/pdf', as_attachment=True, download_name='report.pdf')
+        key = data_fingerprint()
+        if report_status(key) != 'done': write_report(key)
+        return send_file(os.path.abspath(report_path(key)), mimetype='application/pdf', as_attachment=True, download_name='report.pdf')
     except Exception as e: return str(e), 500
 
-if not os.path.exists(app.config['UPLOAD_FOLDER']):
-    os.makedirs(app.config['UPLOAD_FOLDER'])
+
+for folder in (app.config['UPLOAD_FOLDER'], app.config['REPORT_FOLDER']):
+    if not os.path.exists(folder):
+        os.makedirs(folder)
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0')
@@ -0,0 +1,96 @@
+"""Seeded synthetic history for the benchmarks, written straight into every table of the app.
+
+Each day gets a weigh-in with body composition, steps, three to five meals, two or three blood
+pressure readings, mood, sleep, a water counter with its intake events and one or two
+medication doses; an activity on about every other day and a lab panel every 90 days. Values
+depend only on the seed and the date, so a range can be filled in any order or in pieces.
+"""
+import json
+import math
+import random
+from datetime import date, datetime, time, timedelta
+
+MARKERS = (('Glukose', 'mg/dl', 70, 100), ('HbA1c', '%', 4.0, 5.7), ('LDL', 'mg/dl', 0, 116), ('HDL', 'mg/dl', 40, 90),
+           ('Triglyceride', 'mg/dl', 0, 150), ('TSH', 'mU/l', 0.4, 4.0), ('Ferritin', 'ng/ml', 30, 300), ('Vitamin D', 'ng/ml', 30, 100))
+MEDICATIONS = (('Metformin', 'Tabletten', '1, 2'), ('Ramipril', 'Tabletten', '1'), ('Vitamin D3', 'Tropfen', '5, 10'))
+MEALS = ('Haferflocken mit Beeren', 'Vollkornbrot mit Käse', 'Hähnchen mit Reis', 'Linsensuppe', 'Lachs mit Gemüse',
+         'Salat mit Feta', 'Joghurt mit Nüssen', 'Nudeln mit Tomatensoße', 'Apfel', 'Proteinshake')
+ACTIVITIES = ('Running', 'Cycling', 'Walking', 'Swimming', 'Strength Training')
+NOTES = ('', '', '', 'Kopfschmerzen', 'Gut geschlafen', 'Stressiger Tag', 'Müde nach dem Training')
+LAB_EVERY = 90
+FLUSH_DAYS = 200
+
+def day_rng(seed, d):
+    return random.Random(f"{seed}:{d.isoformat()}")
+
+def at(d, hh, mm=0):
+    return datetime.combine(d, time(hh, mm))
+
+def ensure_master_data(hc):
+    """Markers, medications and the profile; returns {medication name: id}."""
+    db = hc.db
+    if not hc.Marker.query.first():
+        db.session.execute(db.insert(hc.Marker), [{'name': n, 'unit': u, 'min_norm': lo, 'max_norm': hi} for n, u, lo, hi in MARKERS])
+    if not hc.Medication.query.first():
+        db.session.execute(db.insert(hc.Medication), [{'name': n, 'unit': u, 'common_dose': c} for n, u, c in MEDICATIONS])
+    if not hc.Profile.query.first():
+        db.session.add(hc.Profile(name='Benchmark', height_cm=178, birthdate=date(1985, 5, 17), target_weight=82))
+    db.session.commit()
+    return dict(db.session.query(hc.Medication.name, hc.Medication.id))
+
+def day_rows(d, meds, seed=1):
+    """{Model name: [row dicts]} for one day."""
+    rng = day_rng(seed, d)
+    n = d.toordinal()
+    weight = 90 + 4 * math.sin(n / 180) + rng.gauss(0, 0.4)
+    fat = 24 + 2 * math.sin(n / 180) + rng.gauss(0, 0.5)
+    rows = {
+        'WeightEntry': [{'date': at(d, 7, rng.randint(0, 59)), 'weight': round(weight, 1), 'fat_percentage': round(fat, 1), 'bmi': round(weight / 1.78 ** 2, 1),
+                         'skeletal_muscle': round(rng.uniform(38, 42), 1), 'muscle_mass': round(weight * 0.7, 1), 'protein': round(rng.uniform(16, 19), 1),
+                         'bmr': rng.randint(1750, 1900), 'fat_free_mass': round(weight * (1 - fat / 100), 1), 'subcutaneous_fat': round(fat * 0.8, 1),
+                         'visceral_fat': rng.randint(8, 12), 'body_water': round(rng.uniform(52, 58), 1), 'bone_mass': round(rng.uniform(3.1, 3.4), 1)}],
+        'Steps': [{'date': at(d, 0), 'count': rng.randint(2000, 16000)}],
+        'FoodEntry': [{'date': at(d, 0), 'description': rng.choice(MEALS), 'calories': rng.randint(150, 900), 'protein': round(rng.uniform(3, 45), 1),
+                       'carbs': round(rng.uniform(5, 110), 1), 'fat': round(rng.uniform(1, 40), 1)} for _ in range(rng.randint(3, 5))],
+        'VitalValue': [{'date': at(d, h, rng.randint(0, 59)), 'type': 'Blutdruck/Puls', 'value_sys': rng.randint(110, 145), 'value_dia': rng.randint(65, 95),
+                        'value_pulse': rng.randint(52, 85)} for h in (7, 13, 21)[:rng.randint(2, 3)]],
+        'MoodEntry': [{'date': at(d, 0), 'mood_score': rng.randint(3, 10), 'energy_score': rng.randint(2, 10), 'notes': rng.choice(NOTES)}],
+        'SleepEntry': [{'date': d, 'duration_hours': round(rng.uniform(5, 9), 1), 'quality': rng.randint(1, 5)}],
+        'MedicationEntry': [{'date': at(d, 0), 'medication_id': meds[name], 'amount': '1'} for name in rng.sample(sorted(meds), rng.randint(1, 2))],
+        'Activity': [],
+        'LabValue': [],
+    }
+    events = [{'time': f"{h:02d}:{rng.randint(0, 59):02d}", 'ml': rng.choice((200, 250, 330, 500))} for h in sorted(rng.sample(range(7, 23), rng.randint(4, 10)))]
+    rows['WaterEntry'] = [{'date': d, 'amount_ml': sum(e['ml'] for e in events), 'events': json.dumps(events)}]
+    if rng.random() < 0.5:
+        minutes = rng.randint(20, 90)
+        rows['Activity'].append({'date': at(d, 18, rng.randint(0, 59)), 'type': rng.choice(ACTIVITIES), 'duration_min': minutes,
+                                 'distance_km': round(minutes / rng.uniform(5, 12), 2), 'source': 'bench', 'garmin_id': f"bench-{seed}-{d.isoformat()}"})
+    if n % LAB_EVERY == 0:
+        for name, unit, lo, hi in MARKERS:
+            rows['LabValue'].append({'date': at(d, 0), 'name': name, 'value': round(rng.uniform(lo * 0.8, hi * 1.2), 2), 'unit': unit, 'min_norm': lo, 'max_norm': hi})
+    return rows
+
+def fill(hc, start, end, seed=1):
+    """Insert the history of start <= day < end into the first profile of the app module `hc` (inside an app context) and compute its rollups.
+
+    Returns the number of rows written per table.
+    """
+    db = hc.db
+    meds = ensure_master_data(hc)
+    pid = hc.current_profile_id()
+    counts, pending, days = {}, {}, []
+    d = start
+    while d < end:
+        for model, rows in day_rows(d, meds, seed).items(): pending.setdefault(model, []).extend(rows)
+        days.append(d); d += timedelta(days=1)
+        if len(days) == FLUSH_DAYS or d == end:
+            for model, rows in pending.items():
+                if not rows: continue
+                Model = getattr(hc, model)
+                db.session.execute(db.insert(Model), [{**r, 'profile_id': pid} for r in rows])
+                counts[Model.__tablename__] = counts.get(Model.__tablename__, 0) + len(rows)
+            hc.mark_changed(*counts, *{hc.lab_version_name(r['name']) for r in pending['LabValue']})
+            hc.refresh_rollups(*days); db.session.commit()
+            pending, days = {}, []
+    return counts
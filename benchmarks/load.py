@@ -0,0 +1,140 @@
+"""Load test: requests per second and latency percentiles per route under concurrent clients.
+
+Boots gunicorn with the repo's gunicorn.conf.py on a throwaway SQLite database (or on
+--database-url, e.g. a scratch Postgres), seeds --days of history through /api/batch and then
+lets --clients keep-alive connections hit each route for --seconds. With --url an already
+running instance is measured instead, without seeding; note that the write routes add data.
+
+    python benchmarks/load.py [--clients 16] [--seconds 10] [--days 365] [--workers 2] [--threads 4] [--json out.json]
+"""
+import json
+import time
+import random
+import argparse
+import threading
+import http.client
+import urllib.parse
+import urllib.request
+from datetime import date, timedelta
+from server import workdir, free_port, start_gunicorn, wait_until_up
+
+TODAY = date.today().isoformat()
+FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+# name -> (method, path, form body); writes redirect (302) like the browser forms do
+ROUTES = {
+    'index': ('GET', '/', None),
+    'chart_data': ('GET', '/chart_data', None),
+    'daily_summary': ('GET', f'/daily_summary/{TODAY}', None),
+    'add_water': ('POST', '/add_water', 'amount=250'),
+    'add_vital': ('POST', '/add_vital', f'date={TODAY}&time=08:00&sys=120&dia=80&pulse=60'),
+    'add_food': ('POST', '/add_food', f'food_date={TODAY}&food_desc=Haferflocken&food_cal=350&food_pro=12&food_carb=60&food_fat=6'),
+}
+SEED_BATCH = 5000
+
+def history(days, seed=1):
+    """Entries for /api/batch: a weigh-in, steps, three meals, two BP readings, mood, sleep and water per day."""
+    rnd = random.Random(seed)
+    weight = 95.0
+    for i in range(days, 0, -1):
+        d = (date.today() - timedelta(days=i)).isoformat()
+        weight += rnd.uniform(-0.3, 0.25)
+        yield {'type': 'weight', 'date': d, 'time': '07:00', 'weight': round(weight, 1)}
+        yield {'type': 'steps', 'date': d, 'count': rnd.randint(2000, 15000)}
+        for meal, kcal in (('Frühstück', 450), ('Mittagessen', 750), ('Abendessen', 650)):
+            yield {'type': 'food', 'date': d, 'description': meal, 'calories': kcal + rnd.randint(-100, 100), 'protein': 25, 'carbs': 60, 'fat': 20}
+        for t in ('08:00', '20:00'):
+            yield {'type': 'vital', 'date': d, 'time': t, 'sys': rnd.randint(110, 140), 'dia': rnd.randint(70, 90), 'pulse': rnd.randint(55, 80)}
+        yield {'type': 'mood', 'date': d, 'mood': rnd.randint(3, 9), 'energy': rnd.randint(3, 9), 'notes': ''}
+        yield {'type': 'sleep', 'date': d, 'duration': round(rnd.uniform(5, 9), 1), 'quality': rnd.randint(1, 5)}
+        yield {'type': 'water', 'date': d, 'amount_ml': rnd.randint(4, 12) * 250}
+
+def seed(base_url, days):
+    batch = []
+    for entry in history(days):
+        batch.append(entry)
+        if len(batch) == SEED_BATCH: post_batch(base_url, batch); batch = []
+    if batch: post_batch(base_url, batch)
+
+def post_batch(base_url, entries):
+    req = urllib.request.Request(base_url + '/api/batch', data=json.dumps(entries).encode(), headers={'Content-Type': 'application/json'})
+    urllib.request.urlopen(req, timeout=300).read()
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, round(p / 100 * (len(sorted_values) - 1)))] if sorted_values else None
+
+def run_route(host, port, route, clients, seconds):
+    """Hit one route from `clients` threads with a connection each; returns throughput and latency stats."""
+    method, path, body = ROUTES[route]
+    latencies, errors, lock = [], [0], threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        conn, own, failed = http.client.HTTPConnection(host, port, timeout=60), [], 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=FORM if body else {})
+                resp = conn.getresponse(); resp.read()
+                if resp.status >= 400: failed += 1; continue
+            except (OSError, http.client.HTTPException):
+                failed += 1; conn.close(); conn = http.client.HTTPConnection(host, port, timeout=60); continue
+            own.append(time.perf_counter() - started)
+        conn.close()
+        with lock: latencies.extend(own); errors[0] += failed
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    def ms(v): return round(v * 1000, 1) if v is not None else None
+    return {'route': route, 'requests': len(latencies), 'errors': errors[0], 'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': ms(percentile(latencies, 50)), 'p95_ms': ms(percentile(latencies, 95)), 'p99_ms': ms(percentile(latencies, 99)), 'max_ms': ms(latencies[-1] if latencies else None)}
+
+def run(args, base_url):
+    parsed = urllib.parse.urlsplit(base_url)
+    results = []
+    for route in args.routes:
+        r = run_route(parsed.hostname, parsed.port or 80, route, args.clients, args.seconds)
+        print(f"{r['route']:14} {r['rps']:8.1f} req/s  p50 {r['p50_ms']} ms  p95 {r['p95_ms']} ms  p99 {r['p99_ms']} ms  errors {r['errors']}")
+        results.append(r)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--days', type=int, default=365, help='history to seed before measuring')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--worker-class', default='gthread')
+    parser.add_argument('--routes', type=lambda s: s.split(','), default=list(ROUTES), help=f"comma-separated subset of {','.join(ROUTES)}")
+    parser.add_argument('--database-url', help='scratch database to run against instead of a temporary SQLite file (its tables are created)')
+    parser.add_argument('--url', help='measure a running instance instead of starting one')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+    unknown = [r for r in args.routes if r not in ROUTES]
+    if unknown: parser.error(f"unknown routes: {', '.join(unknown)}")
+
+    settings = {'clients': args.clients, 'seconds': args.seconds}
+    if args.url:
+        results = run(args, args.url.rstrip('/'))
+    else:
+        settings.update(days=args.days, workers=args.workers, threads=args.threads, worker_class=args.worker_class, database='postgres' if args.database_url else 'sqlite')
+        with workdir(args.database_url) as path:
+            port = free_port()
+            proc = start_gunicorn(path, port, args.database_url, WEB_CONCURRENCY=args.workers, GUNICORN_THREADS=args.threads, GUNICORN_WORKER_CLASS=args.worker_class)
+            try:
+                wait_until_up(port, proc)
+                base_url = f'http://127.0.0.1:{port}'
+                started = time.perf_counter(); seed(base_url, args.days)
+                print(f"seeded {args.days} days in {time.perf_counter() - started:.1f} s")
+                results = run(args, base_url)
+            finally:
+                proc.terminate(); proc.wait()
+    if args.json:
+        with open(args.json, 'w') as f: json.dump({'settings': settings, 'routes': results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Route benchmarks on synthetic history: latency and SQL statements per request for the hot routes.
+
+Fills a temporary SQLite database with 1, 5 and 10 years of data (see data.py) and calls each
+route through Flask's test client. "cold" runs clear every cache first (response cache, report
+files, chart rasters, weight trend, lab series and insights frame), "warm" runs repeat the request
+as is. Results are written as JSON; --compare reports routes that got slower than a previous run
+by more than --tolerance, or issue more statements, and exits with status 1 if there are any:
+
+    python benchmarks/routes.py [--years 1,5,10] [--repeat 3] [--routes index,pdf] [--json out.json] [--compare baseline.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+from datetime import date, datetime, timedelta
+from server import ROOT
+import data
+
+TODAY = date.today()
+# name -> path; {today} and {year_ago} are filled in per run
+ROUTES = {
+    'index': '/',
+    'daily_summary': '/daily_summary/{today}',
+    'chart_data': '/chart_data',
+    'chart_data_year': '/chart_data?from={year_ago}',
+    'api_list': '/api/food?limit=200',
+    'rollup_year': '/api/rollup?days=365',
+    'labs': '/api/labs',
+    'food_suggest': '/api/foods?q=hafer',
+    'insights': '/api/insights?days=365',
+    'export': '/export',
+    'pdf': '/pdf',
+}
+# Slowdowns below this many ms count as noise in --compare
+NOISE_MS = 5
+
+class StatementCounter:
+    def __init__(self, engine, event):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+def reset_caches(hc):
+    hc.response_cache.invalidate(hc.ALL_TABLES)
+    hc._weight_trend.clear()
+    hc._lab_series.clear()
+    hc.food_catalogs.clear()
+    hc.charts._cache.clear()
+    hc.insights._states.clear()
+    folder = hc.app.config['REPORT_FOLDER']
+    for f in os.listdir(folder): os.remove(os.path.join(folder, f))
+
+def measure(hc, client, counter, path, repeat):
+    """Median ms and statements per request, cold and warm."""
+    result = {}
+    for mode in ('cold', 'warm'):
+        times, statements = [], []
+        for _ in range(repeat):
+            if mode == 'cold': reset_caches(hc)
+            counter.count = 0
+            started = time.perf_counter()
+            resp = client.get(path)
+            body = resp.get_data() # drains streamed responses such as /export
+            times.append(time.perf_counter() - started); statements.append(counter.count)
+            if resp.status_code != 200: raise RuntimeError(f"{path}: HTTP {resp.status_code}")
+        result[f'{mode}_ms'] = round(statistics.median(times) * 1000, 1)
+        result[f'{mode}_statements'] = statistics.median(statements)
+    result['bytes'] = len(body)
+    return result
+
+def run(args):
+    # The app reads its configuration at import time, so it is imported once the environment points at the scratch database
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(args.workdir, 'bench.db')}"
+    os.environ['EXPORT_FOLDER'] = os.path.join(args.workdir, 'export')
+    os.chdir(args.workdir); sys.path.insert(0, ROOT)
+    import app as hc
+
+    results = []
+    with hc.app.app_context():
+        hc.db.create_all(); hc.ensure_indexes()
+        counter = StatementCounter(hc.db.engine, hc.db.event)
+        client = hc.app.test_client()
+        filled, rows = 0, {}
+        for years in sorted(args.years):
+            # Grow the history backwards from today, so each size contains the previous one
+            started = time.perf_counter()
+            for table, n in data.fill(hc, TODAY - timedelta(days=years * 365 - 1), TODAY - timedelta(days=filled * 365 - 1) if filled else TODAY + timedelta(days=1)).items():
+                rows[table] = rows.get(table, 0) + n
+            filled = years
+            print(f"{years:2d} years: {sum(rows.values())} rows generated in {time.perf_counter() - started:.1f} s")
+            for route in args.routes:
+                path = ROUTES[route].format(today=TODAY.isoformat(), year_ago=(TODAY - timedelta(days=365)).isoformat())
+                r = {'years': years, 'route': route, 'path': path, **measure(hc, client, counter, path, args.repeat)}
+                print(f"   {route:16} cold {r['cold_ms']:9.1f} ms {r['cold_statements']:6g} stmts   warm {r['warm_ms']:9.1f} ms {r['warm_statements']:6g} stmts   {r['bytes']:>10} B")
+                results.append(r)
+            results.append({'years': years, 'route': None, 'rows': dict(sorted(rows.items()))})
+    return results
+
+def compare(results, baseline, tolerance):
+    """Routes that got slower (cold or warm) or issue more statements than in `baseline`."""
+    before = {(r['years'], r['route']): r for r in baseline['results'] if r['route']}
+    regressions = []
+    for r in results:
+        b = before.get((r['years'], r['route']))
+        if not r['route'] or not b: continue
+        for mode in ('cold', 'warm'):
+            ms, base_ms = r[f'{mode}_ms'], b[f'{mode}_ms']
+            if ms > base_ms * (1 + tolerance) and ms - base_ms > NOISE_MS:
+                regressions.append(f"{r['route']} ({r['years']}y, {mode}): {base_ms} -> {ms} ms")
+            if r[f'{mode}_statements'] > b[f'{mode}_statements']:
+                regressions.append(f"{r['route']} ({r['years']}y, {mode}): {b[f'{mode}_statements']:g} -> {r[f'{mode}_statements']:g} statements")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=lambda s: [int(y) for y in s.split(',')], default=[1, 5, 10])
+    parser.add_argument('--repeat', type=int, default=3, help='requests per route and mode; the median is reported')
+    parser.add_argument('--routes', type=lambda s: s.split(','), default=list(ROUTES), help=f"comma-separated subset of {','.join(ROUTES)}")
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='results of an earlier run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown for --compare (default 0.25)')
+    args = parser.parse_args()
+    unknown = [r for r in args.routes if r not in ROUTES]
+    if unknown: parser.error(f"unknown routes: {', '.join(unknown)}")
+    out = os.path.abspath(args.json) if args.json else None
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f: baseline = json.load(f)
+
+    args.workdir = tempfile.mkdtemp(prefix='healthcockpit-bench-')
+    try: results = run(args)
+    finally: shutil.rmtree(args.workdir, ignore_errors=True)
+
+    if out:
+        with open(out, 'w') as f:
+            json.dump({'created': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(), 'repeat': args.repeat, 'results': results}, f, indent=2)
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions: print(f"REGRESSION {line}")
+        if regressions: sys.exit(1)
+        print("No regressions.")
+
+if __name__ == '__main__':
+    main()
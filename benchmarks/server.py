@@ -0,0 +1,44 @@
+"""Throwaway app instances for the benchmarks: a temp directory with its own database and a gunicorn server on a free port."""
+import os
+import sys
+import time
+import shutil
+import socket
+import tempfile
+import contextlib
+import subprocess
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def env_for(workdir, database_url=None):
+    return {**os.environ, 'PYTHONPATH': ROOT, 'DATABASE_URL': database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+            'EXPORT_FOLDER': os.path.join(workdir, 'export')}
+
+@contextlib.contextmanager
+def workdir(database_url=None):
+    """Temp directory with the schema created in `database_url` (default: a SQLite file inside it)."""
+    path = tempfile.mkdtemp(prefix='healthcockpit-bench-')
+    try:
+        subprocess.run([sys.executable, '-c', 'from app import app, db\nwith app.app_context(): db.create_all()'], cwd=path, env=env_for(path, database_url), check=True)
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0)); return s.getsockname()[1]
+
+def start_gunicorn(path, port, database_url=None, **settings):
+    """Start gunicorn with the repo's gunicorn.conf.py; `settings` are extra environment variables (WEB_CONCURRENCY=2, ...)."""
+    env = {**env_for(path, database_url), **{k: str(v) for k, v in settings.items()}}
+    return subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'), '-b', f'127.0.0.1:{port}', 'app:app'],
+                            cwd=path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def wait_until_up(port, proc, timeout=60):
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if proc.poll() is not None: raise RuntimeError(f'gunicorn exited with {proc.returncode}')
+        try: urllib.request.urlopen(f'http://127.0.0.1:{port}/api/cache', timeout=5).read(); return
+        except OSError: time.sleep(0.2)
+    raise RuntimeError('gunicorn did not become ready')
@@ -0,0 +1,105 @@
+"""Startup cost of the app: import time, RSS after import and per-worker memory under gunicorn.
+
+"before" imports the modules that app.py used to load at top level (pandas, matplotlib.pyplot,
+fpdf, fitparse) ahead of the app, "after" imports the app alone. The gunicorn part boots WORKERS
+workers with and without GUNICORN_PRELOAD and reports RSS and PSS (RSS with shared pages split
+between the processes sharing them) per worker. Runs against a throwaway SQLite database:
+
+    python benchmarks/startup.py [--runs 5] [--workers 3] [--json out.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import urllib.request
+from server import env_for, workdir, free_port, start_gunicorn
+
+EAGER_MODULES = ('pandas', 'matplotlib.pyplot', 'fpdf', 'fitparse')
+
+IMPORT_PROBE = """
+import sys, time
+t = time.perf_counter()
+for m in sys.argv[1:]: __import__(m)
+import app
+elapsed = time.perf_counter() - t
+rss = next(int(l.split()[1]) for l in open('/proc/self/status') if l.startswith('VmRSS:'))
+print(elapsed, rss)
+"""
+
+def measure_import(path, modules, runs):
+    times, rss = [], []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', IMPORT_PROBE, *modules], cwd=path, env=env_for(path), capture_output=True, text=True, check=True).stdout.split()
+        times.append(float(out[0])); rss.append(int(out[1]))
+    return {'import_ms': round(statistics.median(times) * 1000, 1), 'rss_mb': round(statistics.median(rss) / 1024, 1)}
+
+def memory_mb(pid):
+    """(rss, pss) of one process in MB from /proc/<pid>/smaps_rollup."""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:'): fields[parts[0]] = int(parts[1])
+    return round(fields['Rss:'] / 1024, 1), round(fields['Pss:'] / 1024, 1)
+
+def children(pid):
+    found = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit(): continue
+        try:
+            with open(f'/proc/{entry}/stat') as f: ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except OSError: continue
+        if ppid == pid: found.append(int(entry))
+    return found
+
+def measure_workers(path, workers, preload, timeout=60):
+    port = free_port()
+    started = time.perf_counter()
+    proc = start_gunicorn(path, port, WEB_CONCURRENCY=workers, GUNICORN_PRELOAD=int(preload))
+    try:
+        # Ready once all workers exist, the server answers and worker memory has stopped growing
+        last = None
+        while time.perf_counter() - started < timeout:
+            time.sleep(0.5)
+            pids = children(proc.pid)
+            if len(pids) < workers: continue
+            try: urllib.request.urlopen(f'http://127.0.0.1:{port}/api/cache', timeout=5).read()
+            except OSError: continue
+            sample = [memory_mb(p) for p in sorted(pids)]
+            if sample == last: break
+            last = sample
+        else: raise RuntimeError('gunicorn did not become ready')
+        boot = time.perf_counter() - started
+        master = memory_mb(proc.pid)
+        return {'preload': preload, 'boot_s': round(boot, 2), 'master_rss_mb': master[0],
+                'worker_rss_mb': [m[0] for m in last], 'worker_pss_mb': [m[1] for m in last],
+                'total_pss_mb': round(master[1] + sum(m[1] for m in last), 1)}
+    finally:
+        proc.terminate(); proc.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    with workdir() as path:
+        results = {
+            'import': {'before': measure_import(path, EAGER_MODULES, args.runs), 'after': measure_import(path, (), args.runs)},
+            'gunicorn': [measure_workers(path, args.workers, preload) for preload in (False, True)],
+        }
+
+    for label, r in results['import'].items():
+        print(f"import app ({label:6}): {r['import_ms']:8.1f} ms  {r['rss_mb']:7.1f} MB RSS")
+    for r in results['gunicorn']:
+        print(f"gunicorn {'preload   ' if r['preload'] else 'no preload'}: boot {r['boot_s']:5.2f} s, "
+              f"worker RSS {r['worker_rss_mb']} MB, worker PSS {r['worker_pss_mb']} MB, total PSS {r['total_pss_mb']} MB")
+    if args.json:
+        with open(args.json, 'w') as f: json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Response cache for the read-heavy dashboard routes.
+
+Entries are tagged with the tables they were built from and stay valid while the version
+counters of those tables are unchanged. The app bumps the counters after every commit, so a
+hit needs no database query at all; the TTL only bounds staleness from writes made outside
+the app. With a `path` the counters and entries live in a small SQLite file shared by all
+worker processes, otherwise in process memory.
+"""
+import json
+import time
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+class MemoryStore:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def versions(self, tables):
+        return json.dumps([self.counters.get(t, 0) for t in tables])
+
+    def bump(self, tables):
+        with self.lock:
+            for t in tables: self.counters[t] = self.counters.get(t, 0) + 1
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry: self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, token, expires, value):
+        with self.lock:
+            self.entries[key] = (token, expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries: self.entries.popitem(last=False)
+
+    def __len__(self): return len(self.entries)
+
+class SQLiteStore:
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, token TEXT, expires REAL, used REAL, value BLOB)",
+        "CREATE INDEX IF NOT EXISTS entries_used ON entries (used)",
+    )
+
+    def __init__(self, path, max_entries):
+        self.path, self.max_entries = path, max_entries
+        self.local = threading.local()
+        conn = self.conn()
+        for stmt in self.SCHEMA: conn.execute(stmt)
+        # Connections must not be inherited by forked workers; each thread opens its own on first use
+        conn.close(); self.local.conn = None
+
+    def conn(self):
+        if getattr(self.local, 'conn', None) is None:
+            self.local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            self.local.conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn.execute("PRAGMA synchronous=NORMAL")
+        return self.local.conn
+
+    def versions(self, tables):
+        rows = dict(self.conn().execute(f"SELECT name, version FROM versions WHERE name IN ({','.join('?' * len(tables))})", tables))
+        return json.dumps([rows.get(t, 0) for t in tables])
+
+    def bump(self, tables):
+        self.conn().executemany("INSERT INTO versions VALUES (?, 1) ON CONFLICT (name) DO UPDATE SET version = version + 1", [(t,) for t in tables])
+
+    def get(self, key):
+        conn = self.conn()
+        row = conn.execute("SELECT token, expires, value FROM entries WHERE key = ?", (key,)).fetchone()
+        if not row: return None
+        conn.execute("UPDATE entries SET used = ? WHERE key = ?", (time.time(), key))
+        return row[0], row[1], pickle.loads(row[2])
+
+    def set(self, key, token, expires, value):
+        conn = self.conn()
+        conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", (key, token, expires, time.time(), pickle.dumps(value)))
+        conn.execute("DELETE FROM entries WHERE expires < ? OR key IN (SELECT key FROM entries ORDER BY used DESC LIMIT -1 OFFSET ?)", (time.time(), self.max_entries))
+
+    def __len__(self): return self.conn().execute("SELECT count(*) FROM entries").fetchone()[0]
+
+class ResponseCache:
+    def __init__(self, max_entries=256, ttl=300, path=None):
+        self.store = SQLiteStore(path, max_entries) if path else MemoryStore(max_entries)
+        self.ttl = ttl
+        self.hits = self.misses = 0
+
+    def get(self, key, tables):
+        """(value, None) on a hit; on a miss (None, token) where token is passed on to set()."""
+        token = self.store.versions(tables)
+        entry = self.store.get(key)
+        if entry and entry[0] == token and entry[1] > time.time():
+            self.hits += 1
+            return entry[2], None
+        self.misses += 1
+        return None, token
+
+    def set(self, key, token, value):
+        # The token was read before the value was built, so a write in between leaves a stale token and never a stale hit
+        self.store.set(key, token, time.time() + self.ttl, value)
+
+    def invalidate(self, tables):
+        if tables: self.store.bump(sorted(tables))
+
+    def stats(self):
+        return {'backend': 'sqlite' if isinstance(self.store, SQLiteStore) else 'memory', 'entries': len(self.store),
+                'hits': self.hits, 'misses': self.misses, 'ttl': self.ttl}
@@ -0,0 +1,139 @@
+"""Catalog of the foods logged so far, for autocomplete and "log again" on the food form.
+
+Entries are grouped by their description (case and whitespace ignored); an item carries the number
+of entries and the macros of the most recent one. Everything lives in process memory: every food
+entry as (key, date, description, macros) by id, and a word-prefix index (every prefix of every word,
+up to MAX_PREFIX characters). The best TOP keys per query are cached until the next change, so a
+keystroke is a dict lookup; the first query after a write ranks the keys under its prefix once.
+
+Changes are applied per row and are idempotent (upsert() sets a row to its current state, remove()
+drops it), so the app can feed the catalog from its commits and reload it at any time without
+counting anything twice. `version` is the write counter of food_entry the catalog reflects; the app
+uses it to notice writes the catalog has not seen.
+"""
+import re
+import heapq
+import threading
+
+MAX_PREFIX = 12
+LIMIT = 10
+MAX_LIMIT = 50
+TOP = MAX_LIMIT
+MAX_CACHED = 10000
+
+def normalize(description):
+    return ' '.join((description or '').split()).casefold()
+
+def words(key):
+    return re.findall(r'\w+', key)
+
+def prefixes(key):
+    return {w[:i] for w in words(key) for i in range(1, min(len(w), MAX_PREFIX) + 1)}
+
+class FoodCatalog:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.rows = {}     # food_entry id -> (key, date, description, calories, protein, carbs, fat); key '' for entries without a description
+        self.ids = {}      # key -> ids of its entries
+        self.last = {}     # key -> id of its most recent entry (by date, then id)
+        self.prefixes = {} # word prefix -> keys
+        self.top = {}      # query words -> best TOP keys, until the next change
+        self.max_id = 0
+        self.version = None
+        self.synced_at = 0
+
+    def load(self, rows, version, now=0):
+        """Replace the contents with `rows` of (id, date, description, calories, protein, carbs, fat).
+
+        Built aside and swapped in, so lookups keep being answered from the old contents meanwhile.
+        """
+        new, keys, latest = FoodCatalog(), {}, {}
+        for id, date, description, *macros in rows:
+            key = keys.get(description)
+            if key is None: key = keys[description] = normalize(description)
+            new.rows[id] = (key, date, description, *macros)
+            if not key: continue
+            ids = new.ids.get(key)
+            if ids is None: new.ids[key] = {id}; latest[key] = (date, id)
+            else:
+                ids.add(id)
+                if (date, id) > latest[key]: latest[key] = (date, id)
+        new.last = {key: id for key, (_, id) in latest.items()}
+        for key in new.ids:
+            for p in prefixes(key): new.prefixes.setdefault(p, set()).add(key)
+        with self.lock:
+            self.rows, self.ids, self.last, self.prefixes, self.top = new.rows, new.ids, new.last, new.prefixes, {}
+            self.max_id = max(self.rows, default=0)
+            self.version, self.synced_at = version, now
+
+    def update(self, rows, version=None):
+        with self.lock:
+            for row in rows: self.upsert(row)
+            if version is not None: self.version = version
+
+    def upsert(self, row):
+        id, date, description, *macros = row
+        key = normalize(description)
+        with self.lock:
+            self.remove(id)
+            self.rows[id] = (key, date, description, *macros)
+            self.max_id = max(self.max_id, id)
+            if not key: return
+            if key not in self.ids:
+                self.ids[key] = set()
+                for p in prefixes(key): self.prefixes.setdefault(p, set()).add(key)
+            self.ids[key].add(id)
+            if key not in self.last or self._order(id) > self._order(self.last[key]): self.last[key] = id
+            self.top.clear()
+
+    def remove(self, id):
+        with self.lock:
+            row = self.rows.pop(id, None)
+            # SQLite hands out the highest id again once its row is deleted
+            if id == self.max_id: self.max_id = max(self.rows, default=0)
+            key = row and row[0]
+            if not key: return
+            self.ids[key].discard(id)
+            self.top.clear()
+            if self.ids[key]:
+                if self.last[key] == id: self.last[key] = max(self.ids[key], key=self._order)
+                return
+            del self.ids[key], self.last[key]
+            for p in prefixes(key):
+                keys = self.prefixes[p]; keys.discard(key)
+                if not keys: del self.prefixes[p]
+
+    def _order(self, id):
+        return self.rows[id][1], id
+
+    def _rank(self, key):
+        # Most logged first, then most recently logged
+        return len(self.ids[key]), self.rows[self.last[key]][1]
+
+    def item(self, description):
+        key = normalize(description)
+        with self.lock:
+            if key not in self.ids: return None
+            _, date, description, calories, protein, carbs, fat = self.rows[self.last[key]]
+            return {'description': description, 'count': len(self.ids[key]), 'last_date': date.strftime('%Y-%m-%d'),
+                    'calories': calories or 0, 'protein': protein or 0, 'carbs': carbs or 0, 'fat': fat or 0}
+
+    def suggest(self, q='', limit=LIMIT):
+        """Items with a word starting with each word of `q`, best first; an empty `q` gives the most logged foods."""
+        qwords = tuple(words(normalize(q)))
+        with self.lock:
+            top = self.top.get(qwords)
+            if top is None:
+                if len(self.top) >= MAX_CACHED: self.top.clear()
+                top = self.top[qwords] = heapq.nlargest(TOP, self._matches(qwords), key=self._rank)
+            return [self.item(k) for k in top[:limit]]
+
+    def _matches(self, qwords):
+        if not qwords: return self.ids.keys()
+        sets = sorted((self.prefixes.get(w[:MAX_PREFIX], set()) for w in qwords), key=len)
+        keys = sets[0].intersection(*sets[1:])
+        long_words = [w for w in qwords if len(w) > MAX_PREFIX]
+        if long_words: keys = [k for k in keys if all(any(kw.startswith(w) for kw in words(k)) for w in long_words)]
+        return keys
+
+    def __len__(self): return len(self.ids)
@@ -0,0 +1,108 @@
+"""Chart rendering for the PDF report and downsampling for the dashboard charts.
+
+Charts are drawn with matplotlib's object-oriented Agg API (no pyplot global state) into
+in-memory RGB rasters. Specs and results are plain data so rendering can run in a process
+pool, and each raster is memoized under a fingerprint of its spec.
+"""
+import os
+import json
+import zlib
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+CHART_WORKERS = int(os.environ.get('CHART_WORKERS', min(3, os.cpu_count() or 1)))
+CACHE_SIZE = 32
+# Imported on first render only; the dashboard needs this module for lttb() alone
+MATPLOTLIB_MODULES = ('matplotlib.dates', 'matplotlib.figure', 'matplotlib.backends.backend_agg')
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+
+def chart_spec(kind, title, ylabel, x, series):
+    """kind is 'line' or 'bar'; series is a list of dicts with values, color and optional label/marker."""
+    return {'kind': kind, 'title': title, 'ylabel': ylabel, 'x': list(x), 'series': series}
+
+def fingerprint(spec):
+    return hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()
+
+def render_chart(spec, dpi=150):
+    """Rasterize one chart; returns {'w', 'h', 'data'} with zlib-compressed 8-bit RGB rows."""
+    import matplotlib.dates # registers the datetime unit converters
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=(8, 4), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    for s in spec['series']:
+        if spec['kind'] == 'bar': ax.bar(spec['x'], s['values'], color=s['color'], label=s.get('label'))
+        else: ax.plot(spec['x'], s['values'], color=s['color'], label=s.get('label'), marker=s.get('marker'))
+    if any(s.get('label') for s in spec['series']): ax.legend()
+    ax.set_title(spec['title'])
+    ax.set_ylabel(spec['ylabel'])
+    ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+    canvas.draw()
+    rgba = np.asarray(canvas.buffer_rgba())
+    return {'w': rgba.shape[1], 'h': rgba.shape[0], 'data': zlib.compress(np.ascontiguousarray(rgba[:, :, :3]).tobytes())}
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # forkserver children start from a clean process that has already imported this module and matplotlib
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            ctx = multiprocessing.get_context(method)
+            if method == 'forkserver': ctx.set_forkserver_preload([__name__, *MATPLOTLIB_MODULES])
+            _pool = ProcessPoolExecutor(max_workers=CHART_WORKERS, mp_context=ctx)
+        return _pool
+
+def render_charts(specs):
+    """Render several specs concurrently, reusing memoized rasters for unchanged series."""
+    keys = [fingerprint(s) for s in specs]
+    results = {}
+    with _cache_lock:
+        for k in keys:
+            if k in _cache: _cache.move_to_end(k); results[k] = _cache[k]
+    missing = {k: s for k, s in zip(keys, specs) if k not in results}
+    if missing:
+        if CHART_WORKERS > 1 and len(missing) > 1:
+            futures = {k: _get_pool().submit(render_chart, s) for k, s in missing.items()}
+            rendered = {k: f.result() for k, f in futures.items()}
+        else:
+            rendered = {k: render_chart(s) for k, s in missing.items()}
+        with _cache_lock:
+            for k, raster in rendered.items():
+                _cache[k] = raster
+            while len(_cache) > CACHE_SIZE: _cache.popitem(last=False)
+        results.update(rendered)
+    return [results[k] for k in keys]
+
+def lttb(x, y, n):
+    """Indices of the n points kept by Largest-Triangle-Three-Buckets (x ascending).
+
+    The first and last point are always kept; for each bucket in between the point forming the
+    largest triangle with the previously kept point and the next bucket's average wins.
+    """
+    x = np.asarray(x, dtype=float); y = np.asarray(y, dtype=float); size = len(x)
+    if n >= size or n < 3: return np.arange(size)
+    ok = ~np.isnan(y)
+    if not ok.all(): y = np.interp(x, x[ok], y[ok]) if ok.any() else np.zeros(size)
+    edges = np.linspace(1, size - 1, n - 1).astype(int)
+    # Average of each bucket via cumulative sums; the last bucket looks ahead to the final point
+    cx, cy = np.concatenate(([0], np.cumsum(x))), np.concatenate(([0], np.cumsum(y)))
+    counts = np.diff(edges)
+    avg_x = np.append(((cx[edges[1:]] - cx[edges[:-1]]) / counts)[1:], x[-1])
+    avg_y = np.append(((cy[edges[1:]] - cy[edges[:-1]]) / counts)[1:], y[-1])
+    keep = np.empty(n, dtype=int); keep[0], keep[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        s, e = edges[i], edges[i + 1]
+        area = np.abs((x[a] - avg_x[i]) * (y[s:e] - y[a]) - (x[a] - x[s:e]) * (avg_y[i] - y[a]))
+        a = s + int(area.argmax()); keep[i + 1] = a
+    return keep
@@ -0,0 +1,46 @@
+"""Columnar export of the database tables as typed Parquet or Arrow IPC files, for analysis tools.
+
+Each table becomes one file with its raw columns: DateTime as timestamp, Date as date32, Float as
+float64 and Integer as int64, all nullable where the column is, so pandas (read_parquet/read_feather)
+and DuckDB load them without re-parsing strings. Rows arrive in batches from a server-side cursor
+and every batch is written as one row group (Parquet) or record batch (Arrow), so memory is bounded
+by the batch size instead of the table. pyarrow is imported on the first export.
+"""
+from datetime import date, datetime
+
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+COMPRESSION = 'zstd'
+
+def arrow_type(pa, column):
+    try: py = column.type.python_type
+    except NotImplementedError: py = str
+    # datetime before date: it is a subclass
+    if issubclass(py, datetime): return pa.timestamp('us')
+    if issubclass(py, date): return pa.date32()
+    if issubclass(py, bool): return pa.bool_()
+    if issubclass(py, int): return pa.int64()
+    if issubclass(py, float): return pa.float64()
+    return pa.string()
+
+def schema(table):
+    import pyarrow as pa
+    return pa.schema([pa.field(c.name, arrow_type(pa, c), nullable=c.nullable) for c in table.columns])
+
+def write_table(out, table, batches, fmt='parquet'):
+    """Write `batches` (lists of row tuples in column order) of a SQLAlchemy table to the binary file `out`; returns the row count."""
+    import pyarrow as pa
+    if fmt not in FORMATS: raise ValueError(f"Unknown format {fmt!r}, expected one of {', '.join(FORMATS)}")
+    s = schema(table)
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(out, s, compression=COMPRESSION)
+    else:
+        writer = pa.ipc.new_file(out, s, options=pa.ipc.IpcWriteOptions(compression=COMPRESSION))
+    rows = 0
+    with writer: # an empty table still gets a file with its typed columns
+        for batch in batches:
+            if not batch: continue
+            columns = zip(*batch)
+            writer.write_batch(pa.RecordBatch.from_arrays([pa.array(col, type=f.type) for col, f in zip(columns, s)], schema=s))
+            rows += len(batch)
+    return rows
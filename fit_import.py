@@ -0,0 +1,103 @@
+"""Garmin FIT parsing for the bulk import.
+
+parse_fit() turns one file into plain rows (activity sessions, daily steps, weigh-ins and
+resting heart rate) so it can run in a worker process; the app merges the results and
+upserts them in a single transaction.
+"""
+import io
+import os
+import zipfile
+import hashlib
+import threading
+import multiprocessing
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ProcessPoolExecutor
+
+FIT_WORKERS = int(os.environ.get('FIT_WORKERS', os.cpu_count() or 1))
+FIT_EPOCH = datetime(1989, 12, 31)
+# fitparse 1.2 predates monitoring_hr_data, so it is requested and read by message/field number
+HR_DATA = 211
+MESSAGES = ('file_id', 'session', 'monitoring_info', 'monitoring', 'weight_scale', HR_DATA)
+# weight_scale field -> WeightEntry column
+WEIGHT_FIELDS = {
+    'weight': 'weight', 'percent_fat': 'fat_percentage', 'bmi': 'bmi', 'muscle_mass': 'muscle_mass',
+    'bone_mass': 'bone_mass', 'percent_hydration': 'body_water', 'basal_met': 'bmr', 'visceral_fat_rating': 'visceral_fat'
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def to_local(ts):
+    """FIT timestamps are UTC; the app stores naive local time."""
+    return ts.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+def parse_fit(name, data):
+    """Parse one FIT file; errors are reported per file instead of failing the whole import."""
+    from fitparse import FitFile # only needed while importing, not by the web workers
+    result = {'file': name, 'activities': [], 'steps': {}, 'weights': [], 'heart_rate': {}, 'error': None}
+    try:
+        serial, last_ts, offset, steps = None, None, None, {}
+        for msg in FitFile(io.BytesIO(data)).get_messages(MESSAGES):
+            v = msg.get_values()
+            if msg.name == 'file_id':
+                serial = v.get('serial_number')
+            elif msg.name == 'session' and v.get('start_time'):
+                start = v['start_time']
+                seconds = v.get('total_timer_time') or v.get('total_elapsed_time') or 0
+                result['activities'].append({
+                    # Stable across re-imports: device serial (or file hash) plus the session start
+                    'garmin_id': f"{serial or hashlib.sha1(data).hexdigest()[:16]}-{int((start - FIT_EPOCH).total_seconds())}",
+                    'date': to_local(start), 'type': str(v.get('sport') or 'generic').replace('_', ' ').title(),
+                    'duration_min': round(seconds / 60), 'distance_km': round(v['total_distance'] / 1000, 2) if v.get('total_distance') else None,
+                    'source': 'garmin'
+                })
+            elif msg.name == 'monitoring_info' and v.get('timestamp') and isinstance(v.get('local_timestamp'), datetime):
+                offset = v['local_timestamp'] - v['timestamp']
+            elif msg.mesg_num == HR_DATA:
+                raw = {f.def_num: f.raw_value for f in msg.fields}
+                bpm = raw.get(1) or raw.get(0)  # current_day_resting_heart_rate, resting_heart_rate
+                if raw.get(253) is not None and bpm:
+                    ts = FIT_EPOCH + timedelta(seconds=raw[253])
+                    result['heart_rate'][(ts + offset if offset is not None else to_local(ts)).date()] = bpm
+            elif msg.name == 'monitoring':
+                ts = v.get('timestamp')
+                if ts is None and v.get('timestamp_16') is not None and last_ts:
+                    # 16-bit timestamps count on from the last full one, modulo 2^16 seconds
+                    base = int((last_ts - FIT_EPOCH).total_seconds())
+                    ts = last_ts + timedelta(seconds=(v['timestamp_16'] - base) & 0xFFFF)
+                if ts is None: continue
+                last_ts = ts
+                day = (ts + offset if offset is not None else to_local(ts)).date()
+                if v.get('steps') is not None:
+                    # Step counts are cumulative per activity type within a day
+                    key = (day, v.get('activity_type'))
+                    steps[key] = max(steps.get(key, 0), v['steps'])
+            elif msg.name == 'weight_scale' and v.get('timestamp') and isinstance(v.get('weight'), (int, float)):
+                result['weights'].append({'date': to_local(v['timestamp']), **{col: v.get(f) for f, col in WEIGHT_FIELDS.items()}})
+        for (day, _), count in steps.items():
+            result['steps'][day] = result['steps'].get(day, 0) + count
+    except Exception as e:
+        result['error'] = str(e) or type(e).__name__
+    return result
+
+def read_zip(stream):
+    """(name, bytes) of every .fit member of a zip archive."""
+    with zipfile.ZipFile(stream) as zf:
+        return [(os.path.basename(i.filename), zf.read(i)) for i in zf.infolist() if not i.is_dir() and i.filename.lower().endswith('.fit')]
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            ctx = multiprocessing.get_context(method)
+            if method == 'forkserver': ctx.set_forkserver_preload([__name__, 'fitparse'])
+            _pool = ProcessPoolExecutor(max_workers=FIT_WORKERS, mp_context=ctx)
+        return _pool
+
+def parse_files(items):
+    """Parse (name, bytes) pairs, in a process pool when there is more than one file; keeps input order."""
+    if FIT_WORKERS > 1 and len(items) > 1:
+        names, datas = zip(*items)
+        return list(_get_pool().map(parse_fit, names, datas, chunksize=max(1, len(items) // (FIT_WORKERS * 4))))
+    return [parse_fit(name, data) for name, data in items]
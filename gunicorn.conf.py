@@ -0,0 +1,39 @@
+"""Gunicorn settings; every value can be overridden from the environment (see README, Maintenance)."""
+import os
+import gc
+import shutil
+import tempfile
+
+# Threaded workers, one per core: a slow /pdf or /export occupies one thread instead of the whole server
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+# Time in-flight requests get to finish on restart or shutdown before workers are killed
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# Import the app once in the master and fork the workers from it, so its modules are shared copy-on-write
+preload_app = os.environ.get('GUNICORN_PRELOAD', '0') == '1'
+
+# Workers must share the response cache, or a write only invalidates the worker that handled it,
+# and their request metrics, or /metrics only reports the worker that answers the scrape
+_cache_file = _metrics_dir = None
+if workers > 1 and not os.environ.get('RESPONSE_CACHE_PATH'):
+    _cache_file = os.environ['RESPONSE_CACHE_PATH'] = os.path.join(tempfile.gettempdir(), f'healthcockpit-cache-{os.getpid()}.db')
+if workers > 1 and not os.environ.get('METRICS_PATH'):
+    _metrics_dir = os.environ['METRICS_PATH'] = os.path.join(tempfile.gettempdir(), f'healthcockpit-metrics-{os.getpid()}')
+
+def when_ready(server):
+    # Objects that exist before the fork are never collected again, so the GC does not touch (and copy) their pages
+    if preload_app: gc.freeze()
+
+def post_fork(server, worker):
+    if preload_app:
+        # Connections opened in the master (none normally) must not be shared with the workers
+        from app import app, db
+        with app.app_context(): db.engine.dispose()
+
+def on_exit(server):
+    for path in (_cache_file, f'{_cache_file}-wal', f'{_cache_file}-shm'):
+        if _cache_file and os.path.exists(path): os.remove(path)
+    if _metrics_dir: shutil.rmtree(_metrics_dir, ignore_errors=True)
@@ -0,0 +1,109 @@
+"""Cross-metric insights over the daily rollups.
+
+The aligned daily frame stays in memory between requests. When the rollups change only
+the rows updated since the last load are merged in, and the rolling means are recomputed
+from the first changed day on, so a new entry costs a few rows instead of the full history.
+Each profile has its own frame (`scope`).
+"""
+import threading
+from datetime import timedelta
+import numpy as np
+
+METRICS = ('sleep_hours', 'steps', 'kcal', 'mood_avg', 'energy_avg', 'sys_avg', 'dia_avg', 'pulse_avg', 'weight')
+ROLLING_WINDOWS = (7, 30)
+MIN_PAIRS = 14
+WEEKDAYS = ('Mo', 'Di', 'Mi', 'Do', 'Fr', 'Sa', 'So')
+# Rows re-read before the watermark, for rollups committed slightly out of order
+OVERLAP = timedelta(minutes=1)
+
+_lock = threading.Lock()
+_states = {} # scope -> {'version', 'frame', 'known', 'rolling', 'watermark', 'results'}
+
+def new_state():
+    return {'version': None, 'frame': None, 'known': None, 'rolling': {}, 'watermark': None, 'results': {}}
+
+def to_frame(rows):
+    import pandas as pd # loaded on the first insights request, not at app start
+    df = pd.DataFrame.from_records(rows, columns=('date', 'updated_at') + METRICS)
+    df['date'] = pd.to_datetime(df['date'])
+    return df.set_index('date').sort_index()
+
+def _merge(s, load, count):
+    """Bring the frame up to date; returns the first day whose rolling means must be recomputed."""
+    import pandas as pd
+    changed = to_frame(load(s['watermark'] - OVERLAP if s['watermark'] is not None else None))
+    known = changed.index if s['known'] is None else s['known'].union(changed.index)
+    if s['frame'] is not None and len(known) != count:
+        # Rows disappeared (rebuild-rollups): start over
+        s.update(frame=None, known=None, rolling={}, watermark=None)
+        return _merge(s, load, count)
+    if not len(changed): return None
+    if changed['updated_at'].notna().any(): s['watermark'] = max(filter(None, [s['watermark'], changed['updated_at'].max().to_pydatetime()]))
+    values = changed[list(METRICS)].astype(float)
+    # Changed days replace their old row completely (a cleared metric must not survive)
+    frame = values if s['frame'] is None else pd.concat([s['frame'].drop(values.index, errors='ignore'), values]).sort_index()
+    # One row per calendar day, so shifts and rolling windows are in days
+    s['frame'], s['known'] = frame.asfreq('D'), known
+    return values.index.min()
+
+def _update_rolling(s, since):
+    frame = s['frame']
+    for w in ROLLING_WINDOWS:
+        cached = s['rolling'].get(w)
+        if cached is None:
+            s['rolling'][w] = frame.rolling(w, min_periods=1).mean(); continue
+        if since is None: continue
+        tail = frame.loc[since - timedelta(days=w - 1):].rolling(w, min_periods=1).mean().loc[since:]
+        cached = cached.reindex(frame.index)
+        cached.loc[tail.index] = tail
+        s['rolling'][w] = cached
+
+def correlations(frame, max_lag):
+    """Pearson r of x on day t against y on day t+lag for all metric pairs; self pairs are skipped."""
+    import pandas as pd
+    present = frame.notna().astype(float)
+    out = []
+    for lag in range(max_lag + 1):
+        later = frame.shift(-lag)
+        r = pd.concat([frame, later.add_suffix('+')], axis=1).corr(min_periods=MIN_PAIRS).iloc[:len(METRICS), len(METRICS):]
+        n = present.T @ later.notna().astype(float)
+        r.columns = n.columns = list(METRICS)
+        pairs = pd.DataFrame({'r': r.stack(), 'n': n.stack()}).reset_index(names=['x', 'y'])
+        pairs = pairs[(pairs.x != pairs.y) & pairs.r.notna()]
+        if lag == 0: pairs = pairs[pairs.x < pairs.y]  # symmetric
+        out.append(pairs.assign(lag=lag))
+    pairs = pd.concat(out, ignore_index=True) if out else pd.DataFrame(columns=['x', 'y', 'r', 'n', 'lag'])
+    pairs = pairs.reindex(pairs.r.abs().sort_values(ascending=False).index)
+    return [{'x': p.x, 'y': p.y, 'lag': int(p.lag), 'r': round(float(p.r), 3), 'n': int(p.n)} for p in pairs.itertuples()]
+
+def _records(df, digits=2):
+    df = df.round(digits).astype(object).where(df.notna(), None)
+    return [{'date': d.strftime('%Y-%m-%d'), **row} for d, row in zip(df.index, df.to_dict('records'))]
+
+def compute(s, max_lag, days):
+    frame = s['frame']
+    weekday = frame.groupby(frame.index.dayofweek).mean().reindex(range(7)).round(2)
+    return {
+        'from': frame.index.min().strftime('%Y-%m-%d'), 'to': frame.index.max().strftime('%Y-%m-%d'), 'days': len(frame),
+        'correlations': correlations(frame, max_lag),
+        'rolling': {f"{w}d": _records(s['rolling'][w].iloc[-days:]) for w in ROLLING_WINDOWS},
+        'weekday': {m: [None if np.isnan(v) else float(v) for v in weekday[m]] for m in METRICS},
+        'weekday_labels': list(WEEKDAYS)
+    }
+
+def insights(version, count, load, max_lag=3, days=90, scope=None):
+    """Insights for the rollups of `scope` at `version` (a counter bumped on every rollup write).
+
+    `count` is the number of rollup rows of the scope and `load(since)` returns its (date, updated_at, *METRICS)
+    rows updated after `since`, or all rows for None.
+    """
+    with _lock:
+        s = _states.setdefault(scope, new_state())
+        if s['version'] != version or s['frame'] is None:
+            since = _merge(s, load, count)
+            if s['frame'] is not None: _update_rolling(s, since)
+            s.update(version=version, results={})
+        if s['frame'] is None or not len(s['frame']): return None
+        key = (max_lag, days)
+        if key not in s['results']: s['results'][key] = compute(s, max_lag, days)
+        return s['results'][key]
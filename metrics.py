@@ -0,0 +1,189 @@
+"""Request metrics for the /metrics endpoint, in the Prometheus text format.
+
+Every request records its latency, status, SQL statements, rows and the time spent in SQL and
+in template rendering under its endpoint. Statements are timed with the engine's cursor events
+and attributed to the request running in the same thread; work outside a request (report
+threads, CLI commands) is not counted. The cost is a few counter updates per request and per
+statement, so it stays on in production. With a `path` every process writes its totals to a
+file in that directory from a background thread (at most once a second) and the scrape adds up
+all files, so whichever gunicorn worker answers reports the whole server.
+"""
+import os
+import json
+import time
+import heapq
+import threading
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+FLUSH_INTERVAL = 1.0
+PREFIX = 'healthcockpit'
+
+class RequestStats:
+    __slots__ = ('started', 'status', 'statements', 'rows', 'sql_seconds', 'render_seconds', 'top', 'stmt_started', 'render_started')
+
+    def __init__(self, keep_top):
+        self.started = time.perf_counter()
+        self.status = None
+        self.statements = self.rows = 0
+        self.sql_seconds = self.render_seconds = 0.0
+        self.top = [] if keep_top else None # min-heap of the slowest (seconds, statement)
+        self.stmt_started = self.render_started = None
+
+def bucket_index(buckets, value):
+    for i, le in enumerate(buckets):
+        if value <= le: return i
+    return len(buckets)
+
+class Metrics:
+    def __init__(self, path=None, slow_ms=0, top=3, logger=None):
+        self.path, self.slow_ms, self.top, self.logger = path, slow_ms, top, logger
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.series = {} # "endpoint method" -> totals, see _empty()
+        self.dirty = False
+        self.flusher_pid = None # the flush thread does not survive a fork, so it is started per process
+        if path: os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def _empty():
+        return {'latency': [0] * (len(LATENCY_BUCKETS) + 1), 'seconds': 0.0, 'count': 0, 'statuses': {},
+                'statements': [0] * (len(STATEMENT_BUCKETS) + 1), 'statements_total': 0, 'rows': 0, 'sql_seconds': 0.0, 'render_seconds': 0.0}
+
+    # --- Request hooks ---
+
+    def start(self):
+        self.local.req = RequestStats(self.slow_ms > 0)
+
+    def set_status(self, status):
+        req = getattr(self.local, 'req', None)
+        if req is not None: req.status = status
+
+    def finish(self, endpoint, method, path, failed=False):
+        req = getattr(self.local, 'req', None)
+        if req is None: return
+        self.local.req = None
+        seconds = time.perf_counter() - req.started
+        status = str(500 if failed or req.status is None else req.status)
+        with self.lock:
+            s = self.series.setdefault(f"{endpoint or 'unmatched'} {method}", self._empty())
+            s['latency'][bucket_index(LATENCY_BUCKETS, seconds)] += 1
+            s['seconds'] += seconds; s['count'] += 1
+            s['statuses'][status] = s['statuses'].get(status, 0) + 1
+            s['statements'][bucket_index(STATEMENT_BUCKETS, req.statements)] += 1
+            s['statements_total'] += req.statements; s['rows'] += req.rows
+            s['sql_seconds'] += req.sql_seconds; s['render_seconds'] += req.render_seconds
+            self.dirty = True
+        if self.path and self.flusher_pid != os.getpid(): self._start_flusher()
+        if self.slow_ms and seconds * 1000 >= self.slow_ms and self.logger:
+            top = '; '.join(f"{t * 1000:.1f} ms {' '.join(sql.split())[:200]}" for t, sql in sorted(req.top, reverse=True))
+            self.logger.warning(f"Slow request {method} {path}: {seconds * 1000:.0f} ms, status {status}, {req.statements} statements "
+                                f"({req.sql_seconds * 1000:.0f} ms SQL, {req.rows} rows), {req.render_seconds * 1000:.0f} ms rendering. Slowest: {top or '-'}")
+
+    # --- SQLAlchemy cursor events ---
+
+    def instrument(self, engine, event):
+        event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        req = getattr(self.local, 'req', None)
+        if req is not None: req.stmt_started = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        req = getattr(self.local, 'req', None)
+        if req is None or req.stmt_started is None: return
+        seconds = time.perf_counter() - req.stmt_started
+        req.stmt_started = None
+        req.statements += 1; req.sql_seconds += seconds
+        # psycopg2 reports the row count of SELECTs as well; sqlite3 only of writes (-1 otherwise)
+        if cursor.rowcount > 0: req.rows += cursor.rowcount
+        if req.top is not None:
+            if len(req.top) < self.top: heapq.heappush(req.top, (seconds, statement))
+            elif seconds > req.top[0][0]: heapq.heapreplace(req.top, (seconds, statement))
+
+    # --- Template signals ---
+
+    def before_render(self, sender, template, context, **extra):
+        req = getattr(self.local, 'req', None)
+        if req is not None: req.render_started = time.perf_counter()
+
+    def rendered(self, sender, template, context, **extra):
+        req = getattr(self.local, 'req', None)
+        if req is not None and req.render_started is not None:
+            req.render_seconds += time.perf_counter() - req.render_started; req.render_started = None
+
+    # --- Export ---
+
+    def snapshot(self):
+        with self.lock: return json.loads(json.dumps(self.series))
+
+    def _start_flusher(self):
+        with self.lock:
+            if self.flusher_pid == os.getpid(): return
+            self.flusher_pid = os.getpid()
+        def loop():
+            while True:
+                time.sleep(FLUSH_INTERVAL)
+                if self.dirty: self.flush()
+        threading.Thread(target=loop, name='metrics-flush', daemon=True).start()
+
+    def flush(self):
+        self.dirty = False
+        target = os.path.join(self.path, f"{os.getpid()}.json")
+        tmp = f"{target}.{threading.get_ident()}.tmp" # the flush thread and a scrape may write at the same time
+        with open(tmp, 'w') as f: json.dump(self.snapshot(), f)
+        os.replace(tmp, target) # readers never see a partial file
+
+    def collect(self):
+        """Totals of this process, or of all processes writing to `path`."""
+        if not self.path: return self.snapshot()
+        self.flush()
+        merged = {}
+        for name in os.listdir(self.path):
+            if not name.endswith('.json'): continue
+            try:
+                with open(os.path.join(self.path, name)) as f: series = json.load(f)
+            except (OSError, ValueError): continue
+            for key, s in series.items():
+                m = merged.setdefault(key, self._empty())
+                for k in ('latency', 'statements'): m[k] = [a + b for a, b in zip(m[k], s[k])]
+                for k in ('seconds', 'count', 'statements_total', 'rows', 'sql_seconds', 'render_seconds'): m[k] += s[k]
+                for status, n in s['statuses'].items(): m['statuses'][status] = m['statuses'].get(status, 0) + n
+        return merged
+
+    def render(self):
+        series = sorted(self.collect().items())
+        lines = []
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}"); lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+        def histogram(name, buckets, counts_key, sum_key, count_of):
+            for key, s in series:
+                endpoint, method = key.split(' ')
+                labels = f'endpoint="{endpoint}",method="{method}"'
+                cumulative = 0
+                for le, n in zip([*buckets, '+Inf'], s[counts_key]):
+                    cumulative += n; lines.append(f'{PREFIX}_{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f'{PREFIX}_{name}_sum{{{labels}}} {s[sum_key]}')
+                lines.append(f'{PREFIX}_{name}_count{{{labels}}} {count_of(s)}')
+        def counter(name, value_key):
+            for key, s in series:
+                endpoint, method = key.split(' ')
+                lines.append(f'{PREFIX}_{name}{{endpoint="{endpoint}",method="{method}"}} {s[value_key]}')
+
+        family('request_duration_seconds', 'histogram', 'Request latency by endpoint.')
+        histogram('request_duration_seconds', LATENCY_BUCKETS, 'latency', 'seconds', lambda s: s['count'])
+        family('requests_total', 'counter', 'Requests by endpoint and status.')
+        for key, s in series:
+            endpoint, method = key.split(' ')
+            for status, n in sorted(s['statuses'].items()):
+                lines.append(f'{PREFIX}_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {n}')
+        family('request_sql_statements', 'histogram', 'SQL statements per request.')
+        histogram('request_sql_statements', STATEMENT_BUCKETS, 'statements', 'statements_total', lambda s: s['count'])
+        family('sql_seconds_total', 'counter', 'Time spent executing SQL statements.')
+        counter('sql_seconds_total', 'sql_seconds')
+        family('sql_rows_total', 'counter', 'Rows returned or written by SQL statements, as reported by the driver.')
+        counter('sql_rows_total', 'rows')
+        family('render_seconds_total', 'counter', 'Time spent rendering templates.')
+        counter('render_seconds_total', 'render_seconds')
+        return '\n'.join(lines) + '\n'
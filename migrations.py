@@ -0,0 +1,233 @@
+"""Numbered schema migrations, each applied once and recorded in the schema_version table.
+
+run() connects with plain SQLAlchemy and first reads the ledger; when nothing is pending it returns
+without importing the app, so a warm start costs one query. Otherwise it takes a lock (a Postgres
+advisory lock, on SQLite the database write lock), re-reads the ledger and runs all pending steps
+with their ledger rows in one transaction, so replicas starting together apply them exactly once and
+a failing step leaves the schema untouched. A new database gets the current schema from the models
+and is stamped with the latest version. Steps that need the models import the app themselves (see
+app_session); as the models move on, a later step that redoes their work replaces them (REDOES).
+
+To change the schema, append a step to MIGRATIONS; never renumber or edit one that has shipped.
+"""
+import io
+import os
+import sys
+import time
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime
+import sqlalchemy as sa
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATABASE_URL = 'sqlite:///local.db' # same default as app.py
+LOCK_KEY = 71_310_005 # pg_advisory_xact_lock key, any constant shared by all replicas
+
+ledger = sa.Table('schema_version', sa.MetaData(),
+                  sa.Column('version', sa.Integer, primary_key=True),
+                  sa.Column('name', sa.String(200), nullable=False),
+                  sa.Column('applied_at', sa.DateTime, nullable=False))
+
+# --- Connection ---
+
+def database_url():
+    url = sa.engine.make_url(os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL))
+    # Flask-SQLAlchemy resolves relative SQLite paths against the instance folder; do the same without Flask
+    if url.get_backend_name() == 'sqlite' and url.database and url.database != ':memory:' and not os.path.isabs(url.database):
+        os.makedirs(os.path.join(ROOT, 'instance'), exist_ok=True)
+        url = url.set(database=os.path.join(ROOT, 'instance', url.database))
+    return url
+
+def create_engine(url=None):
+    engine = sa.create_engine(url or database_url())
+    if engine.dialect.name == 'sqlite':
+        # pysqlite commits before DDL on its own; take over transaction control so DDL is transactional too,
+        # and begin with the write lock so a second process waits instead of migrating at the same time
+        @sa.event.listens_for(engine, 'connect')
+        def _manual_transactions(dbapi_conn, record): dbapi_conn.isolation_level = None
+        @sa.event.listens_for(engine, 'begin')
+        def _begin_immediate(conn):
+            if conn.get_isolation_level() != 'AUTOCOMMIT': conn.exec_driver_sql('BEGIN IMMEDIATE')
+    return engine
+
+def lock(conn):
+    if conn.dialect.name == 'postgresql': conn.execute(sa.text('SELECT pg_advisory_xact_lock(:key)'), {'key': LOCK_KEY})
+
+@contextmanager
+def app_session(conn):
+    """The app's db with db.session joined to the migration transaction (its commits only release a savepoint)."""
+    from sqlalchemy.orm import Session
+    from app import app, db
+    with app.app_context():
+        db.session.registry.set(Session(bind=conn, join_transaction_mode='create_savepoint'))
+        try: yield db
+        finally: db.session.remove()
+
+# --- Helpers for steps ---
+
+def columns(conn, table):
+    return {c['name'] for c in sa.inspect(conn).get_columns(table)}
+
+def add_column(conn, table, name, ddl_type):
+    # SQLite has no ADD COLUMN IF NOT EXISTS
+    if name not in columns(conn, table): conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {name} {ddl_type}")
+
+# --- Steps ---
+
+def create_tables(conn):
+    from app import db
+    db.metadata.create_all(conn)
+
+def add_legacy_columns(conn):
+    for name in ('fat_percentage', 'bmi', 'skeletal_muscle', 'muscle_mass', 'protein', 'bmr', 'fat_free_mass',
+                 'subcutaneous_fat', 'visceral_fat', 'body_water', 'bone_mass'):
+        add_column(conn, 'weight_entry', name, 'FLOAT')
+    add_column(conn, 'medication', 'unit', 'VARCHAR(50)')
+    add_column(conn, 'medication', 'common_dose', 'VARCHAR(100)')
+    add_column(conn, 'profile', 'target_weight', 'FLOAT')
+
+def water_row_per_day(conn):
+    # Fold the old one-row-per-glass water log into one row per day before the unique index is built
+    add_column(conn, 'water_entry', 'events', 'TEXT')
+    conn.exec_driver_sql("UPDATE water_entry SET amount_ml = (SELECT SUM(w.amount_ml) FROM water_entry w WHERE w.date = water_entry.date) "
+                         "WHERE id IN (SELECT MIN(id) FROM water_entry GROUP BY date HAVING COUNT(*) > 1)")
+    conn.exec_driver_sql("DELETE FROM water_entry WHERE id NOT IN (SELECT MIN(id) FROM water_entry GROUP BY date)")
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_water_entry_date")
+
+def create_indexes(conn):
+    with app_session(conn):
+        import app
+        app.ensure_indexes()
+
+def backfill_rollups(conn):
+    # Installations that predate the daily rollups
+    with app_session(conn):
+        import app
+        if not app.DailyRollup.query.first(): print(f"Backfilled rollups for {app.rebuild_rollups()} days.")
+
+def full_text_search(conn):
+    import search
+    search.create(conn)
+    print(f"Indexed {search.rebuild(conn)} entries for search.")
+
+# Entry tables that get a profile_id, and the indexes replaced by their (profile_id, ...) versions
+PROFILE_TABLES = ('lab_value', 'vital_value', 'weight_entry', 'steps', 'food_entry', 'activity', 'medication_entry', 'mood_entry', 'water_entry', 'sleep_entry')
+SINGLE_PROFILE_INDEXES = ('ix_lab_value_date', 'ix_lab_value_name_date', 'ix_vital_value_date', 'ix_weight_entry_date', 'ix_food_entry_date', 'ix_activity_date',
+                          'ix_medication_entry_date', 'ix_medication_entry_medication_id_date', 'ix_mood_entry_date', 'ix_sleep_entry_date',
+                          'ix_water_entry_date', 'uq_water_entry_date')
+
+def profiles(conn):
+    # Every existing entry belongs to the first profile (created if there is none)
+    import search
+    from app import db
+    add_column(conn, 'profile', 'name', 'VARCHAR(100)')
+    pid = conn.exec_driver_sql("SELECT min(id) FROM profile").scalar()
+    if pid is None: pid = conn.execute(db.metadata.tables['profile'].insert().values(name=None)).inserted_primary_key[0]
+    postgres = conn.dialect.name == 'postgresql'
+    search.drop(conn) # the SQLite triggers are recreated with the profile column
+    for table in PROFILE_TABLES:
+        if 'profile_id' in columns(conn, table): continue
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN profile_id INTEGER NOT NULL DEFAULT {int(pid)}" + (" REFERENCES profile (id)" if postgres else ''))
+        if postgres: conn.exec_driver_sql(f"ALTER TABLE {table} ALTER COLUMN profile_id DROP DEFAULT")
+    for name in SINGLE_PROFILE_INDEXES: conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+    # steps.date and activity.garmin_id were declared UNIQUE; they are now unique per profile
+    if postgres:
+        conn.exec_driver_sql("ALTER TABLE steps DROP CONSTRAINT IF EXISTS steps_date_key")
+        conn.exec_driver_sql("ALTER TABLE activity DROP CONSTRAINT IF EXISTS activity_garmin_id_key")
+    else:
+        # SQLite cannot drop a column constraint: copy the tables
+        for table in ('steps', 'activity'):
+            cols = ', '.join(c.name for c in db.metadata.tables[table].columns)
+            conn.exec_driver_sql(f"ALTER TABLE {table} RENAME TO {table}_single_profile")
+            db.metadata.tables[table].create(conn)
+            conn.exec_driver_sql(f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {table}_single_profile")
+            conn.exec_driver_sql(f"DROP TABLE {table}_single_profile")
+    # The rollups are keyed by (profile_id, date) now
+    conn.exec_driver_sql("DROP TABLE IF EXISTS daily_rollup")
+    db.metadata.tables['daily_rollup'].create(conn)
+    with app_session(conn):
+        import app
+        app.ensure_indexes()
+        print(f"Rebuilt rollups for {app.rebuild_rollups()} days.")
+    search.create(conn)
+    print(f"Indexed {search.rebuild(conn)} entries for search.")
+
+MIGRATIONS = [
+    (1, 'create missing tables', create_tables),
+    (2, 'body composition, medication and profile columns', add_legacy_columns),
+    (3, 'one water row per day', water_row_per_day),
+    (4, 'indexes', create_indexes),
+    (5, 'backfill daily rollups', backfill_rollups),
+    (6, 'full-text search index', full_text_search),
+    (7, 'profiles', profiles),
+]
+LATEST = MIGRATIONS[-1][0]
+# Steps that redo earlier ones from scratch: when both are pending the earlier ones are only recorded,
+# since they were written for the schema of their time (7 rebuilds the rollups and the search index per profile)
+REDOES = {7: (5, 6)}
+
+# --- Runner ---
+
+def applied_versions(conn):
+    if not sa.inspect(conn).has_table(ledger.name): return set()
+    return {v for (v,) in conn.execute(sa.select(ledger.c.version))}
+
+def is_new_database(conn):
+    return not any(t != ledger.name for t in sa.inspect(conn).get_table_names())
+
+class LineLog(io.TextIOBase):
+    """A text stream that passes every complete line to `log`."""
+    def __init__(self, log): self.log, self.partial = log, ''
+    def writable(self): return True
+    def write(self, s):
+        *lines, self.partial = (self.partial + s).split('\n')
+        for line in lines: self.log(line)
+        return len(s)
+
+@contextmanager
+def step_output(log):
+    # Steps report what they did with print(); hand those lines to run()'s log instead of stdout.
+    # Steps run before the app serves anything and under the migration lock, so redirecting sys.stdout is safe here
+    if log is print: yield; return
+    out = LineLog(log)
+    with redirect_stdout(out): yield
+    if out.partial: log(out.partial)
+
+def run(engine=None, log=print):
+    """Apply the pending migrations; returns the versions applied. Progress, including what the steps print, goes to `log`."""
+    engine = engine or create_engine()
+    # Read without a transaction, so a warm start neither waits for nor blocks writers
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if {v for v, _, _ in MIGRATIONS} <= applied_versions(conn): return []
+    with engine.begin() as conn:
+        lock(conn)
+        done = applied_versions(conn) # another replica may have finished while we waited for the lock
+        ledger.create(conn, checkfirst=True)
+        if is_new_database(conn):
+            create_tables(conn)
+            pending, redone = [(v, name, None) for v, name, _ in MIGRATIONS], set()
+            log(f"Created the schema at version {LATEST}.")
+        else:
+            pending = [m for m in MIGRATIONS if m[0] not in done]
+            redone = {v for later, _, _ in pending for v in REDOES.get(later, ())}
+            pending = [(v, name, None if v in redone else step) for v, name, step in pending]
+        for version, name, step in pending:
+            started = time.perf_counter()
+            if step:
+                with step_output(log): step(conn)
+                log(f"Migration {version} ({name}): {(time.perf_counter() - started) * 1000:.0f} ms")
+            elif version in redone: log(f"Migration {version} ({name}): redone by a later migration")
+            conn.execute(ledger.insert().values(version=version, name=name, applied_at=datetime.now()))
+    return [v for v, _, _ in pending]
+
+def status(engine=None):
+    engine = engine or create_engine()
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        done = applied_versions(conn)
+    for version, name, _ in MIGRATIONS: print(f"{'applied' if version in done else 'pending'} {version:>4} {name}")
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if '--status' in argv: return status()
+    started = time.perf_counter()
+    applied = run()
+    print(f"Schema at version {LATEST} ({len(applied)} migration(s) applied in {(time.perf_counter() - started) * 1000:.0f} ms).")
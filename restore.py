@@ -0,0 +1,73 @@
+"""Incremental reader for the JSON export, for restoring backups of any size.
+
+read_export() walks the top-level object and yields one (section, row) pair per row, decoding
+a single row at a time from a small text buffer, so memory stays bounded by CHUNK plus the
+largest row instead of the file size. Only the stdlib decoder is used; the export may be
+compact (as written by /export) or pretty-printed.
+"""
+import json
+import codecs
+
+CHUNK = 1 << 16
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+class Reader:
+    def __init__(self, stream, chunk=CHUNK):
+        self.stream, self.chunk = stream, chunk
+        self.decode = codecs.getincrementaldecoder('utf-8-sig')().decode
+        self.buf, self.pos, self.eof = '', 0, False
+
+    def fill(self):
+        """Append the next chunk (dropping what has been consumed); False at the end of the stream."""
+        if self.eof: return False
+        data = self.stream.read(self.chunk)
+        if isinstance(data, str): data = data.encode('utf-8')
+        self.eof = not data
+        self.buf = self.buf[self.pos:] + self.decode(data, final=self.eof)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE: self.pos += 1
+            if self.pos < len(self.buf): return self.buf[self.pos]
+            if not self.fill(): raise ValueError('Invalid export: unexpected end of file')
+
+    def expect(self, chars):
+        c = self.peek()
+        if c not in chars: raise ValueError(f"Invalid export: expected {' or '.join(repr(x) for x in chars)} at {c!r}")
+        self.pos += 1
+        return c
+
+    def value(self):
+        self.peek()
+        while True:
+            try: obj, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                if self.fill(): continue # the value continues in the next chunk
+                raise ValueError(f"Invalid export: {e.msg}")
+            # A number ending exactly at the buffer end may continue in the next chunk
+            if end == len(self.buf) and self.fill(): continue
+            self.pos = end
+            return obj
+
+def read_export(stream):
+    """Yield (section, row) for every row of a health_export.json, and (section, value) for object sections (profile)."""
+    r = Reader(stream)
+    r.expect('{')
+    if r.peek() == '}': return
+    while True:
+        section = r.value()
+        if not isinstance(section, str): raise ValueError('Invalid export: expected a section name')
+        r.expect(':')
+        if r.peek() == '[':
+            r.expect('[')
+            if r.peek() == ']': r.expect(']')
+            else:
+                while True:
+                    yield section, r.value()
+                    if r.expect(',]') == ']': break
+        else:
+            yield section, r.value()
+        if r.expect(',}') == '}': return
@@ -0,0 +1,145 @@
+"""Full-text search over food descriptions, mood notes, lab names and activity types.
+
+SQLite keeps one FTS5 table (search_index) for all four columns, maintained by triggers on the
+source tables, so every write path (forms, batch API, Garmin import, restore) updates it. The rowid
+encodes the source row (id * len(SOURCES) + position), so a trigger deletes by rowid instead of
+scanning. Postgres needs no extra table: each column gets a GIN index on its tsvector and a pg_trgm
+GIN index for substrings, and the query uses exactly those expressions. Every word of the query
+matches as a prefix ("kopf" finds "Kopfschmerzen"); results are ranked (bm25, ts_rank + similarity)
+and can be limited to a date range and to one profile (a "p<id>" token in the SQLite index). On SQLite
+only the RANK_WINDOW most recently entered matches are ranked, which keeps words found in most entries
+at a few milliseconds.
+
+create() is idempotent and runs after db.create_all() and in migrations 6 and 7; rebuild() refills the
+SQLite index from the tables, drop() removes it. Other databases, or SQLite without FTS5, fall back to LIKE.
+"""
+import re
+from datetime import timedelta
+from sqlalchemy import text
+
+# kind (the MODEL_MAP key) -> (table, text column); the order is part of the SQLite rowid, append only
+SOURCES = {
+    'food': ('food_entry', 'description'),
+    'mood': ('mood_entry', 'notes'),
+    'lab': ('lab_value', 'name'),
+    'activity': ('activity', 'type'),
+}
+TS_CONFIG = 'simple' # no stemming: the entries are short and mix German, English and lab abbreviations
+MAX_LIMIT = 200
+RANK_WINDOW = 1000
+MAX_PERIODS = 12
+
+def tokens(q):
+    return re.findall(r'\w+', q or '')
+
+def _rowid(kind, ref='new'):
+    return f"{ref}.id * {len(SOURCES)} + {list(SOURCES).index(kind)}"
+
+def _period(date):
+    # "y2024 m202403": lets a date range narrow the matches inside the index (see periods())
+    return f"'y' || substr({date}, 1, 4) || ' m' || substr({date}, 1, 4) || substr({date}, 6, 2)"
+
+def periods(start, end):
+    """Period tokens covering [start, end): whole years as yYYYY, the months at either end as mYYYYMM."""
+    last = end - timedelta(microseconds=1)
+    out, y, m = [], start.year, start.month
+    while (y, m) <= (last.year, last.month):
+        if m == 1 and y < last.year: out.append(f"y{y}"); y += 1; continue
+        out.append(f"m{y}{m:02d}")
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return out
+
+def ddl(dialect):
+    """The statements that create the index structures for `dialect` (all IF NOT EXISTS)."""
+    stmts = []
+    if dialect == 'sqlite':
+        stmts.append("CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(body, period, profile, kind UNINDEXED, date UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')")
+        for kind, (table, col) in SOURCES.items():
+            insert = (f"INSERT INTO search_index (rowid, body, period, profile, kind, date) SELECT {_rowid(kind)}, new.{col}, {_period('new.date')}, 'p' || new.profile_id, '{kind}', new.date "
+                      f"WHERE new.{col} IS NOT NULL;")
+            delete = f"DELETE FROM search_index WHERE rowid = {_rowid(kind, 'old')};"
+            stmts.append(f"CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} BEGIN {insert} END")
+            stmts.append(f"CREATE TRIGGER IF NOT EXISTS {table}_search_ad AFTER DELETE ON {table} BEGIN {delete} END")
+            stmts.append(f"CREATE TRIGGER IF NOT EXISTS {table}_search_au AFTER UPDATE OF {col}, date, profile_id ON {table} BEGIN {delete} {insert} END")
+    elif dialect == 'postgresql':
+        stmts.append("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for table, col in SOURCES.values():
+            stmts.append(f"CREATE INDEX IF NOT EXISTS ix_{table}_{col}_fts ON {table} USING GIN (to_tsvector('{TS_CONFIG}', coalesce({col}, '')))")
+            stmts.append(f"CREATE INDEX IF NOT EXISTS ix_{table}_{col}_trgm ON {table} USING GIN ({col} gin_trgm_ops)")
+    return stmts
+
+def fts5_available(conn):
+    return any(row[0] == 'ENABLE_FTS5' for row in conn.exec_driver_sql("PRAGMA compile_options"))
+
+def create(conn):
+    if conn.dialect.name == 'sqlite' and not fts5_available(conn): return
+    for stmt in ddl(conn.dialect.name): conn.exec_driver_sql(stmt)
+
+def drop(conn):
+    """Remove the SQLite index and its triggers, e.g. before create() with a changed layout."""
+    if conn.dialect.name != 'sqlite': return
+    for table in (t for t, _ in SOURCES.values()):
+        for suffix in ('ai', 'ad', 'au'): conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {table}_search_{suffix}")
+    conn.exec_driver_sql("DROP TABLE IF EXISTS search_index")
+
+def rebuild(conn):
+    """Refill the SQLite index from the source tables; returns the rows indexed (Postgres indexes need no refill)."""
+    if conn.dialect.name != 'sqlite' or not has_index(conn): return 0
+    conn.exec_driver_sql("DELETE FROM search_index")
+    for kind, (table, col) in SOURCES.items():
+        conn.exec_driver_sql(f"INSERT INTO search_index (rowid, body, period, profile, kind, date) SELECT {_rowid(kind, table)}, {col}, {_period('date')}, 'p' || profile_id, '{kind}', date "
+                             f"FROM {table} WHERE {col} IS NOT NULL")
+    return conn.exec_driver_sql("SELECT count(*) FROM search_index").scalar()
+
+def has_index(conn):
+    if conn.dialect.name == 'postgresql': return True
+    return conn.dialect.name == 'sqlite' and bool(conn.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'search_index'").first())
+
+def search(conn, q, start=None, end=None, kinds=None, limit=50, indexed=True, profile_id=None):
+    """Entries matching every word of `q` as a prefix, best first: [{'type', 'id', 'date', 'time', 'text', 'rank'}].
+
+    `start`/`end` are datetimes (end exclusive), `profile_id` limits the search to one profile's entries;
+    `indexed=False` forces the LIKE fallback.
+    """
+    words = tokens(q)
+    kinds = [k for k in (kinds or SOURCES) if k in SOURCES]
+    if not words or not kinds: return []
+    params = {'start': start, 'end': end, 'profile': profile_id, 'limit': min(max(limit, 1), MAX_LIMIT)}
+    dialect = conn.dialect.name
+    # SQLite stores dates as ISO text
+    if dialect == 'sqlite': params.update(start=start and str(start), end=end and str(end))
+    if indexed and dialect == 'sqlite':
+        terms = ' '.join(f'"{w}"*' for w in words)
+        match = f"body : ({terms})"
+        if profile_id is not None: match = f"profile : p{int(profile_id)} AND " + match
+        # Only narrow ranges: period tokens are in every row, so OR-ing many of them costs more than checking the date of each match
+        spans = periods(start, end) if start and end else []
+        if 0 < len(spans) <= MAX_PERIODS: match += f" AND period : ({' OR '.join(spans)})"
+        params.update(match=match, window=RANK_WINDOW, **{f"k{i}": k for i, k in enumerate(kinds)})
+        where = (f"search_index MATCH :match AND kind IN ({', '.join(f':k{i}' for i in range(len(kinds)))}) "
+                 "AND (:start IS NULL OR date >= :start) AND (:end IS NULL OR date < :end)")
+        # bm25 costs about 2 µs per match; a common word can match most rows, so only the newest RANK_WINDOW matches are ranked
+        sql = (f"SELECT kind, rowid / {len(SOURCES)}, date, body, -bm25(search_index, 1, 0, 0) AS rank FROM search_index WHERE {where} "
+               f"AND rowid >= coalesce((SELECT rowid FROM search_index WHERE {where} ORDER BY rowid DESC LIMIT 1 OFFSET :window), 0) "
+               "ORDER BY bm25(search_index, 1, 0, 0), date DESC LIMIT :limit")
+    elif indexed and dialect == 'postgresql':
+        params.update(tsq=' & '.join(f"{w}:*" for w in words), raw=q, like=like_pattern(q))
+        parts = [f"SELECT '{kind}' AS kind, id, date, {col} AS body, ts_rank(to_tsvector('{TS_CONFIG}', coalesce({col}, '')), query) + similarity(coalesce({col}, ''), :raw) AS rank "
+                 f"FROM {table}, to_tsquery('{TS_CONFIG}', :tsq) query WHERE (to_tsvector('{TS_CONFIG}', coalesce({col}, '')) @@ query OR {col} ILIKE :like) "
+                 "AND (CAST(:start AS timestamp) IS NULL OR date >= :start) AND (CAST(:end AS timestamp) IS NULL OR date < :end) "
+                 "AND (CAST(:profile AS integer) IS NULL OR profile_id = :profile)"
+                 for kind, (table, col) in SOURCES.items() if kind in kinds]
+        sql = ' UNION ALL '.join(parts) + " ORDER BY rank DESC, date DESC LIMIT :limit"
+    else:
+        # Every word as a substring; unranked, newest first
+        params.update({f"w{i}": like_pattern(w) for i, w in enumerate(words)})
+        parts = [f"SELECT '{kind}' AS kind, id, date, {col} AS body, 0 AS rank FROM {table} WHERE "
+                 + ' AND '.join(f"lower({col}) LIKE lower(:w{i}) ESCAPE '\\'" for i in range(len(words)))
+                 + " AND (:start IS NULL OR date >= :start) AND (:end IS NULL OR date < :end) AND (:profile IS NULL OR profile_id = :profile)"
+                 for kind, (table, col) in SOURCES.items() if kind in kinds]
+        sql = ' UNION ALL '.join(parts) + " ORDER BY date DESC LIMIT :limit"
+    return [{'type': kind, 'id': ref_id, 'date': str(d)[:10], 'time': str(d)[11:16] or None, 'text': body, 'rank': round(float(rank or 0), 4)}
+            for kind, ref_id, d, body, rank in conn.execute(text(sql), params)]
+
+def like_pattern(s):
+    return '%' + re.sub(r'([%_\\])', r'\\\1', s) + '%'
@@ -0,0 +1,46 @@
+"""Weight trend and goal projection, shared by the dashboard and the PDF report.
+
+The rate is the least-squares slope over the recent weigh-ins instead of the difference
+between two single measurements, so one noisy reading barely moves the goal date.
+"""
+from datetime import timedelta
+import numpy as np
+
+WINDOW_DAYS = 30
+MIN_SPAN_DAYS = 7
+Z95 = 1.96  # normal approximation of the 95% interval of the slope
+
+def project_weight(dates, weights, target, now):
+    """Trend and goal projection for weigh-ins sorted by date.
+
+    Fits the last WINDOW_DAYS (or all data if they span less than MIN_SPAN_DAYS) and returns
+    the actual loss so far, the remaining loss, the smoothed daily rate and current trend
+    weight, plus the projected goal date and its early/late bound from the slope's
+    confidence interval (None where the trend does not reach the goal).
+    """
+    t = np.asarray(dates, dtype='datetime64[s]').astype(np.float64) / 86400
+    y = np.asarray(weights, dtype=np.float64)
+    t_now = np.datetime64(now, 's').astype(np.float64) / 86400
+    result = {'lost_so_far': y[0] - y[-1], 'remaining': y[-1] - target, 'daily_rate': 0.0, 'trend_weight': None,
+              'days_to_go': None, 'est_date': None, 'est_early': None, 'est_late': None}
+
+    recent = t >= t_now - WINDOW_DAYS
+    if recent.sum() >= 2 and np.ptp(t[recent]) >= MIN_SPAN_DAYS: t, y = t[recent], y[recent]
+    if len(t) < 2 or np.ptp(t) < 1: return result  # needs two weigh-ins at least a day apart
+
+    tc = t - t.mean(); sxx = tc @ tc
+    slope = tc @ (y - y.mean()) / sxx
+    level = y.mean() + slope * (t_now - t.mean())
+    rate = -slope
+    se = np.sqrt(np.sum((y - y.mean() - slope * tc) ** 2) / (len(t) - 2) / sxx) if len(t) > 2 else None
+    result.update(daily_rate=rate, trend_weight=level)
+
+    def goal_date(r):
+        if r is None or r <= 0: return None, None
+        days = max(int((level - target) / r), 0)
+        return days, now + timedelta(days=days)
+    result['days_to_go'], result['est_date'] = goal_date(rate)
+    if se is not None and result['est_date']:
+        result['est_early'] = goal_date(rate + Z95 * se)[1]
+        result['est_late'] = goal_date(rate - Z95 * se)[1]
+    return result